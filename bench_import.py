@@ -0,0 +1,79 @@
+"""
+twittertools import-time benchmark.
+
+Compares the time and memory needed to import twittertools, which
+loads its third-party dependencies on first use, against importing
+it along with pandas and twitter, as it did when they were imported
+at module load. Each case runs in a fresh interpreter. Peak memory
+is reported only where the resource module is available (not on
+Windows).
+
+Usage:
+python bench_import.py [repeat]
+"""
+
+import statistics
+import subprocess
+import sys
+
+CASES = [('twittertools (lazy)', 'import twittertools'),
+         ('twittertools + twitter', 'import twittertools, twitter'),
+         ('twittertools + pandas + twitter (eager)', 'import twittertools, pandas, twitter')]
+
+# Measure the import inside the child process, excluding interpreter startup.
+# Peak RSS is printed in kB, or as -1 where it can't be measured.
+SCRIPT = '''
+import sys, time
+try:
+    import resource
+except ImportError:
+    resource = None
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else -1
+# macOS reports bytes, Linux kB
+print(elapsed, maxrss // 1024 if sys.platform == 'darwin' else maxrss)
+'''
+
+
+def measure(statement, repeat):
+    """
+    Import modules in fresh interpreters and measure the cost.
+
+    :param statement: Python import statement
+    :param repeat: Number of runs
+    :return: Tuple of median seconds and median peak RSS in kB (None
+             if unavailable), or None if the import fails
+    """
+
+    times, rss = [], []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', SCRIPT.format(statement=statement)],
+                                capture_output=True, text=True)
+        if result.returncode:
+            return None
+        elapsed, maxrss = result.stdout.split()
+        times.append(float(elapsed))
+        rss.append(int(maxrss))
+
+    return statistics.median(times), statistics.median(rss) if min(rss) >= 0 else None
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    print(f'Median of {repeat} runs')
+    print(f'{"case":42} {"import ms":>10} {"peak RSS MB":>12}')
+    for name, statement in CASES:
+        result = measure(statement, repeat)
+        if result is None:
+            print(f'{name:42} {"import failed":>23}')
+            continue
+        seconds, maxrss = result
+        memory = f'{maxrss / 1024:12.1f}' if maxrss is not None else f'{"n/a":>12}'
+        print(f'{name:42} {seconds * 1000:10.1f} {memory}')
+
+
+if __name__ == '__main__':
+    main()
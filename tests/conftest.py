@@ -0,0 +1,17 @@
+import json
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def credentials_file(tmp_path):
+    path = tmp_path / 'credentials.json'
+    path.write_text(json.dumps({'access_token': 'token',
+                                'access_token_secret': 'token secret',
+                                'consumer_key': 'key',
+                                'consumer_secret': 'key secret'}))
+    return str(path)
@@ -0,0 +1,132 @@
+import io
+import time
+
+import pytest
+
+import twittertools
+
+from test_index import make_tweet
+
+
+class FakeTwitterTools:
+    """
+    Fake TwitterTools for the command line: each search query returns two
+    tweets, and the query 'fail' raises an error.
+    """
+
+    def __init__(self, credentials_file, **kwargs):
+        self.credentials = credentials_file
+
+    def search_tweets(self, query, max_requests=5):
+        if query == 'fail':
+            raise RuntimeError('Search failed')
+        return [make_tweet('2019-06-01T12:00:00Z', f'{query} tweet {i}', hashtags=[query],
+                           sequence=sum(map(ord, query)) * 10 + i)
+                for i in range(2)]
+
+    def get_trends(self, woeid=1):
+        return [{'name': '#python', 'query': 'python', 'tweet_volume': 100,
+                 'url': 'http://twitter.com/search?q=python'}]
+
+
+@pytest.fixture(autouse=True)
+def fake_twitter(monkeypatch):
+    monkeypatch.setattr(twittertools, 'TwitterTools', FakeTwitterTools)
+
+
+def test_index_added_from_empty(tmp_path):
+    path = str(tmp_path / 'tweets.db')
+
+    status = twittertools.main(['search', 'python', 'rust', '-o', str(tmp_path / 'tweets.jsonl'),
+                                '--index', path])
+
+    assert status == 0
+    index = twittertools.TweetIndex(path)
+    assert len(index) == 4
+    assert len(index.search('#python')) == 2
+    index.close()
+
+
+class UnreadableStdin:
+    """
+    Stand-in for a non-interactive stdin that never reaches end of file.
+    """
+
+    def isatty(self):
+        return False
+
+    def read(self):
+        raise AssertionError('stdin read')
+
+
+def test_checkpoint_resume_appends_csv(tmp_path, capsys):
+    output = str(tmp_path / 'tweets.csv')
+    checkpoint = str(tmp_path / 'done.txt')
+
+    status = twittertools.main(['search', 'python', 'fail', '-o', output,
+                                '--checkpoint', checkpoint])
+    assert status == 1
+    assert 'Search failed' in capsys.readouterr().err
+    # The failed item isn't recorded, so a restart retries it
+    assert open(checkpoint).read() == 'python\n'
+
+    status = twittertools.main(['search', 'python', 'rust', '-o', output,
+                                '--checkpoint', checkpoint])
+    assert status == 0
+    assert open(checkpoint).read() == 'python\nrust\n'
+
+    lines = open(output, encoding='utf-8-sig').read().splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith('screen_name,')
+    assert [line.count('python tweet') for line in lines[1:]] == [1, 1, 0, 0]
+    assert [line.count('rust tweet') for line in lines[1:]] == [0, 0, 1, 1]
+    # Only the new file starts with a byte order mark
+    assert open(output, 'rb').read().count(b'\xef\xbb\xbf') == 1
+
+
+@pytest.mark.parametrize('name, args, header', [('tweets.csv', [], 'screen_name,'),
+                                                ('tweets.jsonl', [], '{'),
+                                                ('tweets.txt', [], '{'),
+                                                ('tweets.txt', ['-f', 'csv'], 'screen_name,')])
+def test_format_from_extension(tmp_path, name, args, header):
+    output = str(tmp_path / name)
+
+    assert twittertools.main(['search', 'python', '-o', output] + args) == 0
+    lines = open(output, encoding='utf-8-sig').read().splitlines()
+    assert lines[0].startswith(header)
+    assert len(lines) == (3 if header == 'screen_name,' else 2)
+
+
+def test_trends_default_without_stdin(tmp_path, monkeypatch):
+    monkeypatch.setattr('sys.stdin', UnreadableStdin())
+    output = str(tmp_path / 'trends.csv')
+
+    assert twittertools.main(['trends', '-o', output]) == 0
+    lines = open(output, encoding='utf-8-sig').read().splitlines()
+    assert lines == ['woeid,name,query,tweet_volume,url',
+                     '1,#python,python,100,http://twitter.com/search?q=python']
+
+
+@pytest.mark.parametrize('input_args', [[], ['-i', '-']])
+def test_stdin_input(tmp_path, monkeypatch, input_args):
+    # Piped stdin is read by default, as is stdin given explicitly
+    monkeypatch.setattr('sys.stdin', io.StringIO('python\n# comment\n\nrust\n'))
+    output = str(tmp_path / 'tweets.jsonl')
+
+    assert twittertools.main(['search', '-o', output] + input_args) == 0
+    assert len(open(output).read().splitlines()) == 4
+
+
+def test_run_concurrently():
+    def square(unit):
+        if unit == 3:
+            raise ValueError(unit)
+        time.sleep(0.01 * (unit % 3))
+        return unit * unit
+
+    results = list(twittertools.run_concurrently(square, range(10), workers=4))
+
+    assert sorted(unit for unit, _, _ in results) == list(range(10))
+    assert {unit: result for unit, result, error in results if not error} == \
+        {unit: unit * unit for unit in range(10) if unit != 3}
+    assert [(unit, repr(error)) for unit, _, error in results if error] == [(3, 'ValueError(3)')]
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import twittertools
+
+from test_lookup import FakeLookup, run_threads
+
+
+class SlowSearch:
+    """
+    Fake send_request that answers slowly, so identical requests overlap.
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, endpoint, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.2)
+        if self.error:
+            raise self.error
+        return {'statuses': [{'id': 1, 'id_str': '1',
+                              'user': {'id_str': '2', 'screen_name': 'katyperry'}}],
+                'search_metadata': {}}
+
+
+def test_coalesced_responses_are_copies(credentials_file):
+    twt = twittertools.TwitterTools(credentials_file)
+    twt.send_request = search = SlowSearch()
+
+    first, second = run_threads(twt.search_tweets, [('python',), ('python',)])
+
+    assert search.calls == 1
+    assert first == second
+    assert first[0] is not second[0]
+    # Interning one caller's tweets leaves the other's intact
+    twittertools.intern_profiles(first)
+    assert second[0]['user'] == {'id_str': '2', 'screen_name': 'katyperry'}
+
+
+def test_coalesced_retry_later_not_shared(credentials_file):
+    twt = twittertools.TwitterTools(credentials_file, blocking=False)
+    twt.send_request = search = SlowSearch(twittertools.RetryLater('/search/tweets', 0))
+
+    first, second = run_threads(twt.search_tweets, [('python',), ('python',)])
+
+    assert search.calls == 1
+    assert isinstance(first, twittertools.RetryLater)
+    assert isinstance(second, twittertools.RetryLater)
+    assert first is not second
+    assert first.progress is not second.progress
+
+
+def test_batched_lookup_results_are_copies():
+    batcher = twittertools.LookupBatcher(FakeLookup(), window=0.2)
+
+    first, second = run_threads(batcher.lookup, [('/users/lookup', 'screen_name', ['a'], {}),
+                                                 ('/users/lookup', 'screen_name', ['a'], {})])
+
+    assert first == second
+    assert first[0] is not second[0]
+
+
+def test_batched_lookup_retry_later_not_shared():
+    send = FakeLookup(error=twittertools.RetryLater('/users/lookup', 0))
+    batcher = twittertools.LookupBatcher(send, window=0.2)
+
+    first, second = run_threads(batcher.lookup, [('/users/lookup', 'user_id', [1], {}),
+                                                 ('/users/lookup', 'user_id', [1], {})])
+
+    assert len(send.batches) == 1
+    assert isinstance(first, twittertools.RetryLater) and isinstance(second, twittertools.RetryLater)
+    assert first is not second
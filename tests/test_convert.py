@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import twittertools
+
+from test_index import make_tweet
+
+
+@pytest.fixture
+def tweets():
+    # Varying text lengths, so shard boundaries fall mid-line
+    return [make_tweet('2019-06-01T12:00:00Z', f'Tweet {i} ' + 'é' * (i * 7 % 40),
+                       hashtags=[f'tag{i % 3}'], sequence=i)
+            for i in range(60)]
+
+
+def write_jsonl(path, tweets):
+    with open(path, mode='w', encoding='utf-8', newline='\n') as f:
+        for tweet in tweets:
+            f.write(json.dumps(tweet, ensure_ascii=False) + '\n')
+    return str(path)
+
+
+def test_shards_end_on_line_breaks(tmp_path, tweets):
+    path = write_jsonl(tmp_path / 'tweets.jsonl', tweets)
+    data = open(path, mode='rb').read()
+
+    shards = twittertools.get_json_shards([path], shard_bytes=500)
+
+    assert len(shards) > 10
+    assert shards[0][1] == 0 and shards[-1][2] == len(data)
+    for (_, _, end), (_, start, _) in zip(shards, shards[1:]):
+        assert end == start
+        assert data[start - 1:start] == b'\n'
+    loaded = [item for shard in shards for item in twittertools.load_json_items(*shard)]
+    assert loaded == tweets
+
+
+def test_shard_larger_than_file(tmp_path, tweets):
+    path = write_jsonl(tmp_path / 'tweets.jsonl', tweets[:3])
+
+    assert twittertools.get_json_shards([path]) == [(path, 0, len(open(path, 'rb').read()))]
+
+
+def test_json_and_jsonl_mixed(tmp_path, tweets):
+    json_path = str(tmp_path / 'first.json')
+    twittertools.save_to_json(tweets[:20], json_path)
+    jsonl_path = write_jsonl(tmp_path / 'second.jsonl', tweets[20:])
+    output = str(tmp_path / 'tweets.csv')
+
+    shards = twittertools.get_json_shards([json_path, jsonl_path], shard_bytes=500)
+    assert shards[0] == (json_path, None, None)
+
+    count = twittertools.convert_json_archives([json_path, jsonl_path], output,
+                                               processes=2, shard_bytes=500)
+
+    expected = str(tmp_path / 'expected.csv')
+    twittertools.save_tweets(tweets, expected)
+    assert count == 60
+    assert open(output, 'rb').read() == open(expected, 'rb').read()
+
+
+def test_output_same_for_any_process_count(tmp_path, tweets):
+    paths = [write_jsonl(tmp_path / f'part{i}.jsonl', tweets[i::3]) for i in range(3)]
+
+    outputs = []
+    for processes in (1, 2, 4):
+        output = str(tmp_path / f'tweets-{processes}.csv')
+        assert twittertools.convert_json_archives(paths, output, processes=processes,
+                                                  shard_bytes=300) == 60
+        outputs.append(open(output, 'rb').read())
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    # One header row, then rows in input order
+    expected = str(tmp_path / 'expected.csv')
+    twittertools.save_tweets(tweets[0::3] + tweets[1::3] + tweets[2::3], expected)
+    assert outputs[0] == open(expected, 'rb').read()
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        twittertools.convert_json_archives([], str(tmp_path / 'out.xlsx'), file_format='xlsx')
@@ -0,0 +1,158 @@
+import concurrent.futures
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import twittertools
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = twittertools.CrawlQueue(str(tmp_path / 'crawl.db'), max_attempts=3)
+    yield queue
+    queue.close()
+
+
+class ListSink:
+
+    def __init__(self):
+        self.items = []
+
+    def write(self, items):
+        self.items.extend(items)
+
+
+class SlowTwitterTools:
+    """
+    Fake TwitterTools whose timelines take a while, e.g. waiting out a rate limit.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def get_user_tweets(self, endpoint, screen_name=None, **kwargs):
+        time.sleep(self.seconds)
+        return [{'id': 1, 'screen_name': screen_name}]
+
+
+def test_expired_lease_completed_once(queue):
+    queue.put('timeline', screen_name='a')
+    stalled = queue.lease('first', seconds=-1)
+    unit = queue.lease('second')
+
+    assert unit['id'] == stalled['id']
+    assert queue.complete(unit)
+    assert not queue.complete(stalled)
+    assert not queue.fail(stalled, 'late')
+    assert queue.db.execute('SELECT COUNT(*) FROM completions').fetchone()[0] == 1
+
+
+def test_expired_lease_counts_as_attempt(queue):
+    queue.put('timeline', screen_name='a')
+
+    assert queue.lease('first', seconds=-1)['attempts'] == 0
+    assert queue.lease('second', seconds=-1)['attempts'] == 1
+    assert queue.lease('third', seconds=-1)['attempts'] == 2
+    # The third expired lease reaches max_attempts
+    assert queue.lease('fourth') is None
+    assert queue.stats() == {'failed': 1}
+
+
+def test_concurrent_leases_are_exclusive(queue):
+    queue.put_many('timeline', ({'screen_name': str(i)} for i in range(50)))
+    leased = []
+    lock = threading.Lock()
+
+    def work(owner):
+        while True:
+            unit = queue.lease(owner)
+            if unit is None:
+                return
+            with lock:
+                leased.append(unit['id'])
+            assert queue.complete(unit)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(work, range(8)))
+
+    assert sorted(leased) == list(range(1, 51))
+    assert queue.stats() == {'done': 50}
+
+
+def test_worker_renews_lease_while_running(queue):
+    queue.put('timeline', screen_name='a')
+    sink = ListSink()
+    worker = twittertools.CrawlWorker(SlowTwitterTools(1), queue, sink, lease_seconds=0.3)
+
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    time.sleep(0.7)
+    # The unit is still leased to the worker, after its initial lease expired
+    assert queue.lease('other') is None
+    thread.join()
+
+    assert sink.items == [{'id': 1, 'screen_name': 'a'}]
+    assert queue.stats() == {'done': 1}
+
+
+def test_worker_skips_results_after_lost_lease(queue):
+    queue.put('timeline', screen_name='a')
+    sink = ListSink()
+    worker = twittertools.CrawlWorker(SlowTwitterTools(0.6), queue, sink, lease_seconds=0.3)
+    # Stop the worker's renewals from reaching the queue
+    worker.renew_lease = lambda unit, stop: None
+
+    thread = threading.Thread(target=worker.run, kwargs={'max_units': 1})
+    thread.start()
+    time.sleep(0.4)
+    other = queue.lease('other')
+    thread.join()
+
+    assert other['attempts'] == 1
+    assert sink.items == []
+    assert queue.complete(other)
+
+
+@pytest.fixture
+def server(queue):
+    server = twittertools.CrawlQueueServer(queue, ('127.0.0.1', 0), token='secret')
+    thread = threading.Thread(target=server.server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def post(server, method, body, token='secret'):
+    url = f'http://127.0.0.1:{server.address[1]}/{method}'
+    request = urllib.request.Request(url, data=body, headers={'X-Crawl-Token': token})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_remote_queue(server):
+    remote = twittertools.RemoteCrawlQueue(f'http://127.0.0.1:{server.address[1]}', token='secret')
+
+    assert remote.put('timeline', screen_name='a') == 1
+    unit = remote.lease('remote')
+    assert unit['payload'] == {'screen_name': 'a'}
+    assert remote.complete(unit)
+    assert remote.stats() == {'done': 1}
+
+
+@pytest.mark.parametrize('token', ['', 'wrong', 'secre', 'secret2', 'sécret'])
+def test_remote_queue_rejects_bad_token(server, token):
+    assert post(server, 'stats', b'{"args": [], "kwargs": {}}', token) == 403
+
+
+@pytest.mark.parametrize('body', [b'', b'not json', b'[]', b'{"args": []}',
+                                  b'{"args": 1, "kwargs": {}}'])
+def test_remote_queue_rejects_bad_body(server, body):
+    assert post(server, 'stats', body) == 400
+    # The server keeps serving
+    assert post(server, 'stats', b'{"args": [], "kwargs": {}}') == 200
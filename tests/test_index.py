@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+
+import twittertools
+
+
+def make_tweet(created, text, screen_name='katyperry', hashtags=(), mentions=(), urls=(),
+               sequence=0):
+    created = datetime.datetime.strptime(created, '%Y-%m-%dT%H:%M:%SZ')
+    tweet_id = twittertools.get_snowflake_id(created) + sequence
+    return {'id': tweet_id,
+            'id_str': str(tweet_id),
+            'created_at': created.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+            'full_text': text,
+            'user': {'id_str': '21447363', 'screen_name': screen_name},
+            'entities': {'hashtags': [{'text': tag} for tag in hashtags],
+                         'user_mentions': [{'screen_name': name} for name in mentions],
+                         'symbols': [],
+                         'urls': [{'expanded_url': url} for url in urls]}}
+
+
+@pytest.fixture
+def tweets():
+    return [make_tweet('2019-05-01T12:00:00Z', 'Learning Python today', hashtags=['Python']),
+            make_tweet('2019-06-01T12:00:00Z', 'Thanks @ThePSF!', hashtags=['python'],
+                       mentions=['ThePSF']),
+            make_tweet('2019-06-15T12:00:00Z', 'Hello from @gvanrossum', hashtags=['Python'],
+                       mentions=['gvanrossum'], urls=['https://www.python.org/about/']),
+            make_tweet('2019-07-01T12:00:00Z', 'Rust or Python?', screen_name='BarackObama',
+                       hashtags=['rust'], mentions=['ThePSF'])]
+
+
+@pytest.fixture
+def index(tmp_path, tweets):
+    index = twittertools.TweetIndex(str(tmp_path / 'tweets.db'))
+    index.add(tweets)
+    yield index
+    index.close()
+
+
+def ids(tweets, *positions):
+    return [tweets[i]['id'] for i in positions]
+
+
+def test_index_terms():
+    tweet = make_tweet('2019-06-15T12:00:00Z', 'Hello from @gvanrossum https://t.co/x',
+                       hashtags=['Python'], mentions=['GvanRossum'],
+                       urls=['https://www.Python.org/about/'])
+
+    assert twittertools.get_index_terms(tweet) == {
+        '#python', '@gvanrossum', 'from:katyperry', 'url:https://www.python.org/about/',
+        'domain:python.org', 'hello', 'from', 'gvanrossum'}
+
+
+def test_snowflake_id():
+    # Tweet 1288834974657 ms after the Twitter epoch, worker and sequence 0
+    assert twittertools.get_snowflake_id('2010-11-04T01:42:54Z') == 0
+    created = datetime.datetime(2019, 6, 1, tzinfo=datetime.timezone.utc)
+    assert (twittertools.get_snowflake_id(created)
+            == twittertools.get_snowflake_id('2019-06-01T00:00:00Z')
+            == twittertools.get_snowflake_id(datetime.datetime(2019, 6, 1)))
+    assert twittertools.get_snowflake_id('2019-06-01T00:00:01Z') - \
+        twittertools.get_snowflake_id('2019-06-01T00:00:00Z') == 1000 << 22
+
+
+def test_and_or_groups(index, tweets):
+    assert index.search('#python') == ids(tweets, 2, 1, 0)
+    assert index.search('#python', '@thepsf') == ids(tweets, 1)
+    assert index.search('#python', ['@thepsf', '@gvanrossum']) == ids(tweets, 2, 1)
+    assert index.search(['#python', '#rust']) == ids(tweets, 3, 2, 1, 0)
+    assert index.search('python', 'from:barackobama') == ids(tweets, 3)
+    assert index.search('domain:python.org') == ids(tweets, 2)
+    assert index.search('#haskell') == []
+    assert index.search() == []
+
+
+def test_case_folding(index, tweets):
+    assert index.search('#PYTHON', '@ThePSF') == ids(tweets, 1)
+    assert index.search('Python') == ids(tweets, 3, 0)
+
+
+def test_time_ranges(index, tweets):
+    assert index.search('#python', since='2019-06-01T12:00:00Z') == ids(tweets, 2, 1)
+    assert index.search('#python', until='2019-06-01T12:00:00Z') == ids(tweets, 0)
+    assert index.search('#python', since=datetime.datetime(2019, 6, 1),
+                        until=datetime.datetime(2019, 6, 2)) == ids(tweets, 1)
+
+
+def test_limit(index, tweets):
+    assert index.search(['#python', '#rust'], limit=2) == ids(tweets, 3, 2)
+
+
+def test_readd_skipped(index, tweets):
+    assert len(index) == 4
+    assert index.add(tweets) == 0
+    assert index.add(tweets[:1] + [make_tweet('2019-08-01T12:00:00Z', 'New', sequence=1)]) == 1
+    assert len(index) == 5
+    assert index.search('#python') == ids(tweets, 2, 1, 0)
+
+
+def test_get_tweets(index, tweets):
+    assert index.get_tweets(ids(tweets, 1, 0) + [1]) == [tweets[1], tweets[0]]
@@ -0,0 +1,129 @@
+import pytest
+
+import twittertools
+
+
+class FakeListAPI:
+    """
+    Fake endpoint_request for a list's members, recording each request.
+    """
+
+    def __init__(self, members, fail=(), fail_after=0):
+        self.members = list(members)
+        # Endpoints whose requests fail, e.g. with 403 Forbidden,
+        # after fail_after successful requests
+        self.fail = fail
+        self.fail_after = fail_after
+        self.requests = []
+
+    def __call__(self, endpoint, **kwargs):
+        self.requests.append((endpoint, dict(kwargs)))
+        if endpoint == '/lists/members':
+            return {'users': [{'id_str': str(i), 'screen_name': f'User{i}'}
+                              for i in self.members],
+                    'next_cursor': 0}
+        if endpoint in self.fail:
+            if not self.fail_after:
+                return None
+            self.fail_after -= 1
+        return {'id_str': '5', 'member_count': len(self.members)}
+
+    def posted(self, endpoint):
+        return [kwargs for request, kwargs in self.requests if request == endpoint]
+
+
+@pytest.fixture
+def twt(credentials_file):
+    return twittertools.TwitterTools(credentials_file)
+
+
+def test_add_several_users(twt):
+    twt.endpoint_request = api = FakeListAPI([])
+
+    assert twt.post_lists_members_create(list_id=5, user_ids=[1, 2, 3]) == {'id_str': '5',
+                                                                         'member_count': 0}
+    assert api.posted('/lists/members/create') == []
+    assert api.posted('/lists/members/create_all') == [{'list_id': 5, 'user_id': '1,2,3'}]
+
+
+def test_add_one_user(twt):
+    twt.endpoint_request = api = FakeListAPI([])
+
+    twt.post_lists_members_create(list_id=5, screen_names=['katyperry'])
+    assert api.posted('/lists/members/create') == [{'list_id': 5, 'screen_name': 'katyperry'}]
+
+
+def test_batches_of_100(twt):
+    twt.endpoint_request = api = FakeListAPI([])
+
+    twt.post_lists_members_destroy(list_id=5, user_ids=list(range(250)))
+    batches = [kwargs['user_id'].split(',') for kwargs in api.posted('/lists/members/destroy_all')]
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert sum(batches, []) == [str(i) for i in range(250)]
+
+
+def test_sync_removes_before_adding(twt):
+    twt.endpoint_request = api = FakeListAPI(range(5))
+
+    result = twt.sync_list_members(list_id=5, user_ids=[3, 4, 5, 6])
+
+    assert result == {'added': ['5', '6'], 'removed': ['0', '1', '2']}
+    assert [endpoint for endpoint, _ in api.requests] == ['/lists/members',
+                                                          '/lists/members/destroy_all',
+                                                          '/lists/members/create_all']
+    assert api.posted('/lists/members/destroy_all')[0]['user_id'] == '0,1,2'
+    assert api.posted('/lists/members/create_all')[0]['user_id'] == '5,6'
+
+
+def test_sync_screen_names_case_insensitive(twt):
+    twt.endpoint_request = api = FakeListAPI(range(3))
+
+    result = twt.sync_list_members(list_id=5, screen_names=['user0', 'USER1', 'NewUser'])
+
+    assert result == {'added': ['NewUser'], 'removed': ['User2']}
+    assert api.posted('/lists/members/destroy_all')[0]['screen_name'] == 'User2'
+
+
+def test_sync_without_target_is_an_error(twt):
+    twt.endpoint_request = api = FakeListAPI(range(250))
+
+    with pytest.raises(ValueError):
+        twt.sync_list_members(list_id=5)
+    assert api.requests == []
+
+
+def test_sync_to_empty_list(twt):
+    twt.endpoint_request = api = FakeListAPI(range(250))
+
+    result = twt.sync_list_members(list_id=5, user_ids=[])
+    assert len(result['removed']) == 250
+    assert len(api.posted('/lists/members/destroy_all')) == 3
+
+
+def test_failed_batch_stops_and_reports(twt):
+    twt.endpoint_request = api = FakeListAPI([], fail=('/lists/members/create_all',))
+
+    with pytest.raises(twittertools.ListMembersError) as info:
+        twt.post_lists_members_create(list_id=5, user_ids=list(range(200)))
+    assert info.value.done == []
+    assert len(info.value.failed) == 200
+    # Later batches aren't sent after a failure
+    assert len(api.posted('/lists/members/create_all')) == 1
+
+
+def test_failed_sync_reports_changes_made(twt):
+    twt.endpoint_request = FakeListAPI(range(3), fail=('/lists/members/create_all',))
+
+    with pytest.raises(twittertools.ListMembersError) as info:
+        twt.sync_list_members(list_id=5, user_ids=[2] + list(range(100, 300)))
+    assert info.value.result == {'added': [], 'removed': ['0', '1']}
+    assert len(info.value.failed) == 200
+
+
+def test_failed_second_batch(twt):
+    twt.endpoint_request = FakeListAPI([], fail=('/lists/members/destroy_all',), fail_after=1)
+
+    with pytest.raises(twittertools.ListMembersError) as info:
+        twt.post_lists_members_destroy(list_id=5, user_ids=list(range(250)))
+    assert info.value.done == list(range(100))
+    assert info.value.failed == list(range(100, 250))
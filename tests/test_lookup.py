@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+import twittertools
+
+
+class FakeLookup:
+    """
+    Fake lookup request function, recording each batch sent.
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, endpoint, item_keyword, items, **kwargs):
+        with self.lock:
+            self.batches.append(list(items))
+        if self.error:
+            raise self.error
+        # Unknown users, here those starting with 'x', aren't returned
+        return [{'id_str': item, 'screen_name': item.upper()}
+                for item in items if not item.startswith('x')]
+
+
+def run_threads(func, args_list):
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def run(i, args):
+        barrier.wait()
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_lookups_share_a_batch():
+    send = FakeLookup()
+    batcher = twittertools.LookupBatcher(send, window=0.2)
+
+    first, second = run_threads(batcher.lookup, [('/users/lookup', 'screen_name', ['a', 'B'], {}),
+                                                 ('/users/lookup', 'screen_name', ['b', 'c'], {})])
+
+    assert len(send.batches) == 1
+    assert sorted(send.batches[0]) == ['a', 'b', 'c']
+    assert [user['screen_name'] for user in first] == ['A', 'B']
+    assert [user['screen_name'] for user in second] == ['B', 'C']
+
+
+def test_different_kwargs_are_not_merged():
+    send = FakeLookup()
+    batcher = twittertools.LookupBatcher(send, window=0.2)
+
+    run_threads(batcher.lookup, [('/users/lookup', 'screen_name', ['a'], {}),
+                                 ('/users/lookup', 'screen_name', ['a'], {'include_entities': False})])
+
+    assert send.batches == [['a'], ['a']]
+
+
+def test_full_batches_split_at_100():
+    send = FakeLookup()
+    batcher = twittertools.LookupBatcher(send, window=0)
+
+    users = batcher.lookup('/users/lookup', 'user_id', list(range(250)), {})
+
+    assert [len(batch) for batch in send.batches] == [100, 100, 50]
+    assert [user['id_str'] for user in users] == [str(i) for i in range(250)]
+
+
+def test_items_normalized():
+    send = FakeLookup()
+    batcher = twittertools.LookupBatcher(send, window=0)
+
+    users = batcher.lookup('/users/lookup', 'user_id', [' 0123', 123, '123 ', 'x1'], {})
+    assert send.batches == [['123', 'x1']]
+    assert [user['id_str'] for user in users] == ['123']
+
+    users = batcher.lookup('/users/lookup', 'screen_name', [' Katy', 'KATY'], {})
+    assert send.batches[1] == ['katy']
+    assert [user['screen_name'] for user in users] == ['KATY']
+
+
+def test_error_raised_for_every_caller():
+    send = FakeLookup(error=twittertools.RetryLater('/users/lookup', 0))
+    batcher = twittertools.LookupBatcher(send, window=0.2)
+
+    results = run_threads(batcher.lookup, [('/users/lookup', 'user_id', [1, 2], {}),
+                                           ('/users/lookup', 'user_id', [2, 3], {})])
+
+    assert len(send.batches) == 1
+    assert all(isinstance(result, twittertools.RetryLater) for result in results)
+    # Failed batches aren't left pending
+    assert batcher.pending == {} and batcher.open == {}
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'screen_names': []}, {'user_ids': None}])
+def test_empty_profile_lookup(credentials_file, kwargs):
+    twt = twittertools.TwitterTools(credentials_file)
+    twt.lookup_batcher.send = send = FakeLookup()
+
+    assert twt.get_user_profiles(**kwargs) == []
+    assert send.batches == []
@@ -0,0 +1,161 @@
+import email.parser
+import email.policy
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+import twittertools
+
+
+class UploadHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Stand-in for the chunked media upload endpoint, upload.twitter.com/1.1/media/upload.json.
+    """
+
+    def do_GET(self):
+        self.handle_upload()
+
+    def do_POST(self):
+        self.handle_upload()
+
+    def get_params(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                value = part.get_payload(decode=True)
+                params[name] = value if name == 'media' else value.decode()
+        elif body:
+            params.update(urllib.parse.parse_qsl(body.decode()))
+        return url.path, params
+
+    def handle_upload(self):
+        path, params = self.get_params()
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, params['command']))
+
+        if path != '/1.1/media/upload.json':
+            return self.send_json(404, {})
+
+        command = params['command']
+        if command == 'INIT':
+            server.total_bytes = int(params['total_bytes'])
+            server.media_type = params['media_type']
+            server.media_category = params['media_category']
+            return self.send_json(202, {'media_id': 710511363345354753,
+                                        'media_id_string': '710511363345354753'})
+        if command == 'APPEND':
+            # Finish segments out of order
+            time.sleep(random.uniform(0, 0.05))
+            with server.lock:
+                server.segments[int(params['segment_index'])] = params['media']
+            return self.send_json(204, None)
+        if command == 'FINALIZE':
+            server.finalized = b''.join(server.segments[i] for i in sorted(server.segments))
+            return self.send_json(201, self.get_status(params))
+        if command == 'STATUS':
+            return self.send_json(200, self.get_status(params))
+
+    def get_status(self, params):
+        response = {'media_id_string': params['media_id']}
+        if self.server.states:
+            state = self.server.states.pop(0)
+            response['processing_info'] = {'state': state, 'check_after_secs': 0}
+            if state == 'failed':
+                response['processing_info']['error'] = {'name': 'InvalidContent'}
+        return response
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode() if response is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upload_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), UploadHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.segments = {}
+    server.finalized = None
+    # Processing states reported by FINALIZE, then each STATUS
+    server.states = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def twt(credentials_file, upload_server):
+    return twittertools.TwitterTools(credentials_file,
+                                     upload_domain=f'127.0.0.1:{upload_server.server_port}',
+                                     upload_secure=False)
+
+
+def test_chunked_upload(twt, upload_server, tmp_path):
+    data = bytes(random.getrandbits(8) for _ in range(10 * 1000 + 7))
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(data)
+    upload_server.states = ['pending', 'in_progress', 'succeeded']
+
+    media_id = twt.upload_media(path, chunk_size=1000, workers=4)
+
+    assert media_id == '710511363345354753'
+    assert upload_server.total_bytes == len(data)
+    assert upload_server.media_type == 'video/mp4'
+    assert upload_server.media_category == 'tweet_video'
+    assert sorted(upload_server.segments) == list(range(11))
+    assert upload_server.finalized == data
+
+    requests = upload_server.requests
+    assert requests[0] == ('POST', 'INIT')
+    assert requests[1:12] == [('POST', 'APPEND')] * 11
+    assert requests[12:] == [('POST', 'FINALIZE'), ('GET', 'STATUS'), ('GET', 'STATUS')]
+
+
+def test_image_upload_without_processing(twt, upload_server, tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'\x89PNG' + bytes(100))
+
+    assert twt.upload_media(path) == '710511363345354753'
+    assert upload_server.media_category == 'tweet_image'
+    assert upload_server.requests == [('POST', 'INIT'), ('POST', 'APPEND'), ('POST', 'FINALIZE')]
+
+
+def test_failed_processing(twt, upload_server, tmp_path):
+    path = tmp_path / 'animation.gif'
+    path.write_bytes(b'GIF89a' + bytes(100))
+    upload_server.states = ['pending', 'failed']
+
+    with pytest.raises(twittertools.MediaUploadError, match='InvalidContent'):
+        twt.upload_media(path)
+    assert upload_server.media_category == 'tweet_gif'
+    assert upload_server.requests[-1] == ('GET', 'STATUS')
+
+
+def test_empty_file(twt, upload_server, tmp_path):
+    path = tmp_path / 'empty.jpg'
+    path.write_bytes(b'')
+
+    with pytest.raises(twittertools.MediaUploadError):
+        twt.upload_media(path)
+    assert upload_server.requests == []
@@ -0,0 +1,52 @@
+import pickle
+
+import twittertools
+
+
+def make_tweet(tweet_id, statuses_count, name='Katy', retweeted=None):
+    tweet = {'id': tweet_id, 'id_str': str(tweet_id),
+             'user': {'id_str': '21447363', 'screen_name': 'katyperry',
+                      'name': name, 'statuses_count': statuses_count}}
+    if retweeted:
+        tweet['retweeted_status'] = retweeted
+    return tweet
+
+
+def test_later_tweet_wins_after_deletions():
+    profiles = twittertools.ProfileTable()
+    # The user deleted tweets between the two snapshots
+    profiles.intern(make_tweet(200, 90, name='New'))
+    profiles.intern(make_tweet(100, 120, name='Old'))
+
+    assert profiles['21447363']['name'] == 'New'
+    assert profiles.seen['21447363'] == 200
+
+
+def test_nested_users_dated_by_outer_tweet():
+    profiles = twittertools.ProfileTable()
+    profiles.intern(make_tweet(200, 90, name='Direct'))
+    original = make_tweet(50, 95, name='Retweeted')
+    retweet = make_tweet(300, 10, retweeted=original)
+    retweet['user'] = {'id_str': '1', 'screen_name': 'fan'}
+    profiles.intern(retweet)
+
+    assert profiles['21447363']['name'] == 'Retweeted'
+    assert retweet['retweeted_status']['user'] == {'id_str': '21447363',
+                                                   'screen_name': 'katyperry'}
+
+
+def test_same_tweet_tie_broken_by_statuses_count():
+    profiles = twittertools.ProfileTable()
+    profiles.add(make_tweet(100, 120, name='More')['user'], 100)
+    profiles.add(make_tweet(100, 110, name='Fewer')['user'], 100)
+
+    assert profiles['21447363']['name'] == 'More'
+
+
+def test_undated_profile_last_seen_wins():
+    profiles = twittertools.ProfileTable()
+    profiles.intern(make_tweet(200, 120, name='Embedded'))
+    profiles.add({'id_str': '21447363', 'name': 'Looked up', 'statuses_count': 100})
+
+    assert profiles['21447363']['name'] == 'Looked up'
+    assert pickle.loads(pickle.dumps(profiles)).seen == {'21447363': None}
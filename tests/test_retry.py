@@ -0,0 +1,115 @@
+import email.message
+import io
+import time
+import urllib.error
+
+import pytest
+import twitter
+
+import twittertools
+
+
+class ThrottledSearch:
+    """
+    Fake /search/tweets endpoint allowing quota requests per window,
+    then raising RetryLater until the next window.
+    """
+
+    def __init__(self, quota, pages):
+        self.quota = quota
+        self.pages = pages
+        self.used = 0
+        self.requests = []
+
+    def __call__(self, endpoint, **kwargs):
+        if self.used == self.quota:
+            self.used = 0
+            raise twittertools.RetryLater(endpoint, time.time())
+        self.used += 1
+        self.requests.append(kwargs)
+        page = int(kwargs.get('page', 0))
+        response = {'statuses': [{'id': page * 10 + i, 'id_str': str(page * 10 + i)}
+                                 for i in range(2)],
+                    'search_metadata': {}}
+        if page + 1 < self.pages:
+            response['search_metadata']['next_results'] = f'?q=test&page={page + 1}'
+        return response
+
+
+def test_deferred_search_resumes(credentials_file):
+    twt = twittertools.TwitterTools(credentials_file, blocking=False)
+    twt.endpoint_request = endpoint = ThrottledSearch(quota=2, pages=5)
+    observed = []
+    twt.tweet_observers.append(observed.extend)
+
+    queue = twittertools.RetryQueue()
+    future = queue.submit(twt.search_tweets, 'test', max_requests=10)
+    queue.run()
+
+    tweets = future.result()
+    assert [tweet['id'] for tweet in tweets] == [page * 10 + i for page in range(5) for i in range(2)]
+    # Each page is requested and observed once, across three rate limit windows
+    assert [request.get('page', '0') for request in endpoint.requests] == ['0', '1', '2', '3', '4']
+    assert observed == tweets
+
+
+def test_progress_attached_to_retry_later(credentials_file):
+    twt = twittertools.TwitterTools(credentials_file, blocking=False)
+    twt.endpoint_request = ThrottledSearch(quota=1, pages=3)
+
+    try:
+        twt.search_tweets('test')
+    except twittertools.RetryLater as e:
+        progress = e.progress
+    assert len(progress.items) == 2
+
+    resumed = None
+    try:
+        twt.search_tweets('test', progress=progress)
+    except twittertools.RetryLater as e:
+        resumed = e.progress
+    assert resumed is progress
+    assert [tweet['id'] for tweet in progress.items] == [0, 1, 10, 11]
+
+
+def test_rate_limit_reset_floor():
+    breaker = twittertools.CircuitBreaker('/search/tweets')
+    now = time.time()
+
+    # A reset time in the past doesn't retry at once
+    breaker.record_rate_limit(str(int(now) - 3600))
+    assert breaker.wait_time() >= breaker.min_rate_limit_wait - 1
+
+    # Nor does a reset time far in the future wait beyond the window
+    breaker.record_rate_limit(str(int(now) + 86400))
+    assert breaker.wait_time() <= breaker.rate_limit_wait
+
+    breaker.record_rate_limit(str(int(now) + 300))
+    assert 300 <= breaker.wait_time() <= 306
+
+
+def raise_http_error(code):
+    def endpoint(**kwargs):
+        headers = email.message.Message()
+        headers['x-rate-limit-reset'] = str(int(time.time()) + 120)
+        error = urllib.error.HTTPError('https://api.twitter.com/1.1/trends/place.json',
+                                       code, 'Error', headers, io.BytesIO(b''))
+        raise twitter.api.TwitterHTTPError(error, 'trends/place', 'json', kwargs)
+    return endpoint
+
+
+def test_errors_reported_on_stderr(credentials_file, capsys):
+    twt = twittertools.TwitterTools(credentials_file, blocking=False)
+
+    twt.api_endpoint_method['/trends/place'] = raise_http_error(404)
+    assert twt.send_request('/trends/place', _id=1) is None
+
+    twt.api_endpoint_method['/trends/place'] = raise_http_error(429)
+    with pytest.raises(twittertools.RetryLater) as info:
+        twt.send_request('/trends/place', _id=1)
+    assert 119 <= info.value.retry_at - time.time() <= 126
+
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'Error 404 (Not Found) on "/trends/place"' in captured.err
+    assert 'Error 429 (Rate Limit Exceeded) on "/trends/place"' in captured.err
@@ -0,0 +1,39 @@
+import concurrent.futures
+import pickle
+
+import twittertools
+
+
+def make_tweets(n, offset=0):
+    return [{'id_str': str(offset + i),
+             'lang': 'en',
+             'user': {'id_str': str((offset + i) % 500)},
+             'entities': {'hashtags': [{'text': f'Tag{i % 50}'}],
+                          'user_mentions': [],
+                          'urls': [{'expanded_url': f'https://www.example{i % 3}.com/'}]}}
+            for i in range(n)]
+
+
+def test_concurrent_updates():
+    stats = twittertools.TweetStats(k=100)
+    pages = [make_tweets(100, offset=page * 100) for page in range(80)]
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(stats.update, pages))
+
+    report = stats.report()
+    assert report['tweets'] == 8000
+    assert dict(report['hashtags']) == {f'tag{i}': 160 for i in range(50)}
+    assert report['languages'] == [('en', 8000)]
+    assert sum(count for _, count in report['domains']) == 8000
+
+
+def test_pickled_stats_merge():
+    stats = twittertools.TweetStats()
+    stats.update(make_tweets(100))
+    other = pickle.loads(pickle.dumps(stats))
+    other.update(make_tweets(100, offset=100))
+
+    stats.merge(other)
+    assert stats.report()['tweets'] == 300
+    assert stats.report()['languages'] == [('en', 300)]
@@ -25,37 +25,57 @@ https://github.com/ptwobrussell/Mining-the-Social-Web-2nd-Edition
 
 """
 
+import argparse
 import collections
-from contextlib import suppress
+import collections.abc
+import concurrent.futures
+from contextlib import nullcontext, suppress
+import csv
 import datetime
+import functools
 import itertools
 import json
+import math
+import os
+import pathlib
+import random
 import re
+import shutil
+import sys
+import tempfile
+import threading
 import time
+import urllib.parse
 
-import pandas
-# https://pypi.python.org/pypi/twitter
-import twitter
+# Third-party modules, and standard library modules used by only one
+# feature (e.g. sqlite3, mmap), are imported on first use, so that
+# importing twittertools stays fast for short-lived jobs:
+#   twitter, https://pypi.python.org/pypi/twitter, for API requests
+#   pandas, for Parquet output only
 
 
 # --- Define functions --- #
 
 
-def get_api(credentials_file):
+def get_api(credentials_file, domain='api.twitter.com', secure=True):
     """
     Create an authenticated twitter.Twitter() API object.
 
     :param credentials_file: Twitter application credentials JSON file name.
+    :param domain: API domain; default 'api.twitter.com'
+    :param secure: Use HTTPS; default True
     :return: twitter.Twitter() API object
     """
 
+    import twitter
+
     with open(credentials_file) as f:
         data = json.load(f)
         auth = twitter.oauth.OAuth(data['access_token'],
                                    data['access_token_secret'],
                                    data['consumer_key'],
                                    data['consumer_secret'])
-        return twitter.Twitter(auth=auth)
+        return twitter.Twitter(auth=auth, domain=domain, secure=secure)
 
 
 def save_to_json(items, path_or_buf):
@@ -86,8 +106,20 @@ def save_to_csv(items, unpack_func, path_or_buf):
     :return: None
     """
 
-    df = pandas.DataFrame(unpack_func(item) for item in items)
-    df.to_csv(path_or_buf, index=False, encoding='utf-8-sig')
+    rows = (unpack_func(item) for item in items)
+    first_row = next(rows, None)
+
+    if hasattr(path_or_buf, 'write'):
+        f = nullcontext(path_or_buf)
+    else:
+        f = open(path_or_buf, mode='w', encoding='utf-8-sig', newline='')
+
+    with f as out:
+        if first_row is not None:
+            writer = csv.DictWriter(out, fieldnames=list(first_row), lineterminator='\n')
+            writer.writeheader()
+            writer.writerow(first_row)
+            writer.writerows(rows)
 
 
 def save_tweets(tweets, path_or_buf):
@@ -108,14 +140,39 @@ def save_profiles(profiles, path_or_buf):
     Save an iterable of user objects to a CSV file, saving select
     fields as defined in function unpack_profile().
     
-    :param profiles: Iterable of user objects
+    :param profiles: Iterable of user objects, or a mapping of user
+                     objects such as a ProfileTable
     :param path_or_buf: String, file path or file handle
     :return: None
     """
 
+    if isinstance(profiles, collections.abc.Mapping):
+        profiles = profiles.values()
     save_to_csv(profiles, unpack_profile, path_or_buf)
 
 
+def intern_profiles(tweets, profiles=None):
+    """
+    Pull the user objects embedded in each tweet into a shared profile
+    table, replacing each embedded user with a small reference.
+    Tweets are modified in place.
+
+    Example:
+    profiles = intern_profiles(tweets)
+    save_tweets(tweets, 'tweets.csv')
+    save_profiles(profiles, 'profiles.csv')
+
+    :param tweets: Iterable of tweet objects
+    :param profiles: Optional ProfileTable to add to; default new table
+    :return: ProfileTable of deduplicated user objects
+    """
+
+    profiles = ProfileTable() if profiles is None else profiles
+    for tweet in tweets:
+        profiles.intern(tweet)
+    return profiles
+
+
 def get_data(item, *args):
     """
     Search input item dictionary by key words for single-value
@@ -156,13 +213,13 @@ def get_data(item, *args):
         try:
             # return the dictionary item's value
             return item[key]
-        except KeyError:
+        except (KeyError, TypeError):
             # Try item as a list of dictionaries
             try:
                 if item[0].get(key, None):
                     # return the dictionary
                     return item
-            except (IndexError, AttributeError):
+            except (IndexError, KeyError, AttributeError):
                 # Nothing relevant found
                 return None
 
@@ -196,17 +253,9 @@ def unpack_tweet(tweet):
     :return: Ordered dictionary of select tweet field values
     """
 
-    try:
-        if tweet['retweeted_status'] is None:
-            text = tweet['full_text']
-        else:
-            text = tweet['retweeted_status']['full_text']
-    except KeyError:
-        text = tweet['full_text']
-
     fields = [('screen_name', get_data(tweet, 'user', 'screen_name')),
               ('created', format_datetime(get_data(tweet, 'created_at'))),
-              ('full_text', clean_whitespace(text)),
+              ('full_text', clean_whitespace(get_full_text(tweet))),
               ('retweet_count', get_data(tweet, 'retweet_count')),
               ('hashtags', get_data(tweet, 'entities', 'hashtags', 'text')),
               ('mentions', get_data(tweet, 'entities', 'user_mentions', 'screen_name')),
@@ -220,6 +269,24 @@ def unpack_tweet(tweet):
     return collections.OrderedDict(fields)
 
 
+def get_full_text(tweet):
+    """
+    Get a tweet's full text, or the retweeted tweet's full text for
+    a retweet, since a retweet's own text may be truncated.
+
+    :param tweet: Twitter Tweet object
+    :return: Full text string
+    """
+
+    try:
+        if tweet['retweeted_status'] is None:
+            return tweet['full_text']
+        else:
+            return tweet['retweeted_status']['full_text']
+    except KeyError:
+        return tweet['full_text']
+
+
 def unpack_profile(profile):
     """
      Extract select fields from the given user object.
@@ -276,328 +343,1671 @@ def clean_whitespace(text):
     return re.sub('\s+', ' ', text)
 
 
-# --- Define classes --- #
+def get_index_terms(tweet):
+    """
+    Extract the search terms for a tweet, as indexed by TweetIndex:
+    '#hashtag', '@mention', '$symbol', 'from:screen_name',
+    'url:expanded_url', 'domain:host', and normalized text tokens.
+    All terms are lowercase.
 
+    :param tweet: Twitter Tweet object
+    :return: Set of term strings
+    """
 
-class TwitterTools:
+    terms = set()
+    for prefix, args in (('#', ('entities', 'hashtags', 'text')),
+                         ('@', ('entities', 'user_mentions', 'screen_name')),
+                         ('$', ('entities', 'symbols', 'text')),
+                         ('from:', ('user', 'screen_name')),
+                         ('url:', ('entities', 'urls', 'expanded_url'))):
+        values = get_data(tweet, *args)
+        if values:
+            terms.update(prefix + value.lower() for value in str(values).split())
+
+    for term in [term for term in terms if term.startswith('url:')]:
+        host = urllib.parse.urlsplit(term[4:]).hostname
+        if host:
+            terms.add('domain:' + re.sub(r'^www\.', '', host))
+
+    # Index words, leaving out links, which are indexed above
+    text = re.sub(r'https?://\S+', ' ', get_full_text(tweet).lower())
+    terms.update(re.findall(r'\w\w+', text))
+    return terms
+
+
+def get_key_hashes(key):
     """
-    twittertools Twitter API class
+    Hash a key to two independent 64-bit integers. Unlike hash(), the
+    result is the same in every process, so sketches built by different
+    processes can be merged.
+
+    :param key: String key
+    :return: Tuple of two 64-bit integers
     """
 
-    def __init__(self, credentials_file):
-        self.credentials = credentials_file
-        self.api = get_api(self.credentials)
-        if self.api:
-            self.api_endpoint_method = {
-                '/application/rate_limit_status': self.api.application.rate_limit_status,
-                '/favorites/list': self.api.favorites.list,
-                '/followers/ids': self.api.followers.ids,
-                '/friends/ids': self.api.friends.ids,
-                '/lists/create': self.api.lists.create,
-                '/lists/members/create': self.api.lists.members.create,
-                '/lists/members/create_all': self.api.lists.members.create_all,
-                '/search/tweets': self.api.search.tweets,
-                '/statuses/home_timeline': self.api.statuses.home_timeline,
-                '/statuses/user_timeline': self.api.statuses.user_timeline,
-                '/statuses/lookup': self.api.statuses.lookup,
-                '/statuses/update': self.api.statuses.update,
-                '/trends/available': self.api.trends.available,
-                '/trends/closest': self.api.trends.closest,
-                '/trends/place': self.api.trends.place,
-                '/users/lookup': self.api.users.lookup
-            }
+    import hashlib
 
-    def __repr__(self):
-        return f'{self.__class__.__name__}({self.credentials!r})'
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
 
-    def endpoint_request(self, endpoint, *args, **kwargs):
-        """
-        Send Twitter API requests (e.g. GET, POST), handle request errors,
-        and return requested Twitter content.
 
-        :param endpoint: Endpoint request string, e.g. '/search/tweets'
-        :param args: Optional, user-supplied positional arguments
-        :param kwargs: Optional, user-supplied keyword arguments
-        :return: Twitter content, defined by endpoint request.
-        """
+def get_snowflake_id(timestamp):
+    """
+    Convert a time to the smallest tweet ID ("snowflake") that Twitter
+    could assign at that time. Tweet IDs created since November 2010
+    are ordered by creation time, so ID ranges select time ranges.
 
-        def handle_http_error(error, endpoint, wait, retry=True):
-            """
-            Handle common twitter.api.TwitterHTTPError(s)
+    :param timestamp: datetime.datetime (naive values are taken as UTC),
+                      or ISO 8601 string as returned by format_datetime()
+    :return: Tweet ID integer
+    """
 
-            :param error: twitter.api.TwitterHTTPError error object
-            :param endpoint: Endpoint request string, e.g. '/search/tweets'
-            :param wait: Wait period, in seconds
-            :param retry: Retry on error; default True
-            :return: Updated wait time
-            """
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
 
-            # See https://dev.twitter.com/docs/error-codes-responses
+    # Snowflake IDs hold milliseconds since the Twitter epoch in the
+    # bits above 22 bits of worker and sequence numbers.
+    twitter_epoch_ms = 1288834974657
+    ms = int(timestamp.timestamp() * 1000) - twitter_epoch_ms
+    return max(ms, 0) << 22
 
-            errors = {401: '(Unauthorized)',
-                      403: '(Forbidden)',
-                      404: '(Not Found)',
-                      429: '(Rate Limit Exceeded)',
-                      500: '(Internal Server Error)',
-                      502: '(Bad Gateway)',
-                      503: '(Service Unavailable)',
-                      504: '(Gateway Timeout)'
-                      }
 
-            ecode = error.e.code
-            now = f'{datetime.datetime.now():%Y-%m-%d %H:%M:%S}'
-            descr = errors.get(ecode, "(Unknown)")
-            print(f'{now}: Error {ecode} {descr} on "{endpoint}"', flush=True)
+def load_json_items(path, start=None, end=None):
+    """
+    Load Twitter objects from a JSON file written by save_to_json(),
+    or from a JSON Lines file (one object per line, file name ending
+    in ".jsonl"), optionally limited to a byte range of lines.
+
+    :param path: JSON or JSON Lines file path
+    :param start: Optional JSON Lines starting byte offset
+    :param end: Optional JSON Lines ending byte offset
+    :return: List of Twitter objects
+    """
 
-            if ecode in (401, 403, 404):
-                # Caller must handle these errors. Return 0 wait time.
-                return 0
+    if not str(path).endswith('.jsonl'):
+        with open(path, encoding='utf-8-sig') as f:
+            return json.load(f)
 
-            if ecode == 429:
-                if retry:
-                    print('Retrying in 15 minutes...', end=' ', flush=True)
-                    time.sleep(60 * 15)
-                    print('awake and trying again.')
-                    # Return wait time to default 1 second.
-                    return 1
-                else:
-                    # No retries
-                    return 0
+    with open(path, mode='rb') as f:
+        f.seek(start or 0)
+        data = f.read() if end is None else f.read(end - (start or 0))
+    lines = data.decode('utf-8-sig').splitlines()
+    return [json.loads(line) for line in lines if line.strip()]
 
-            if ecode in (500, 502, 503, 504):
-                if retry:
-                    print(f'Retrying in {wait} seconds...', end=' ', flush=True)
-                    time.sleep(wait)
-                    print('awake and trying again.')
-                    wait *= 1.5
-                    if wait < 60 * 30:
-                        return wait
-                print('Too many retries. Quitting.')
 
-            raise error
+def get_json_shards(paths, shard_bytes=64 * 1024 * 1024):
+    """
+    Split input files into shards for parallel conversion. A JSON file
+    is a single shard; a JSON Lines file is split into byte ranges of
+    roughly shard_bytes, each ending on a line boundary.
 
-        # def handle_http_error
+    :param paths: Iterable of JSON or JSON Lines file paths
+    :param shard_bytes: Approximate JSON Lines shard size, in bytes
+    :return: List of (path, start, end) tuples, in input order
+    """
 
-        api_endpoint = self.api_endpoint_method[endpoint]
+    shards = []
+    for path in paths:
+        if not str(path).endswith('.jsonl'):
+            shards.append((path, None, None))
+            continue
+
+        size = os.path.getsize(path)
+        offsets = [0]
+        with open(path, mode='rb') as f:
+            while offsets[-1] + shard_bytes < size:
+                f.seek(offsets[-1] + shard_bytes)
+                f.readline()
+                if f.tell() >= size:
+                    break
+                offsets.append(f.tell())
+        ends = offsets[1:] + [size]
+        shards.extend((path, start, end) for start, end in zip(offsets, ends))
 
-        wait = 1
-        while wait:
-            try:
-                return api_endpoint(*args, **kwargs)
-            except twitter.api.TwitterHTTPError as e:
-                wait = handle_http_error(e, endpoint, wait)
+    return shards
 
-    def get_user_tweets(self, endpoint, screen_name=None, user_id=None,
-                        max_tweets=None, **kwargs):
-        """
-        Request a user's tweets (statuses) according to the endpoint
 
-        :param endpoint: Endpoint request string, e.g. '/statuses/user_timeline'
-        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
-        :param user_id: User's numeric ID
-        :param max_tweets: Maximum tweets requested
-        :param kwargs: Optional, user-supplied keyword arguments
-        :return: A list of Tweet objects
-        """
+def convert_json_shard(shard, unpack_func, part_path, file_format='csv'):
+    """
+    Unpack one input shard and write the result to a partition file.
+    Runs in a worker process for convert_json_archives().
 
-        # No screen_name or user_id implies default to authenticated user
-        if screen_name:
-            kwargs['screen_name'] = screen_name
-        elif user_id:
-            kwargs['user_id'] = user_id
+    :param shard: (path, start, end) tuple from get_json_shards()
+    :param unpack_func: function to extract select fields
+                        from individual Twitter objects
+    :param part_path: Partition output file path
+    :param file_format: 'csv' or 'parquet'
+    :return: Number of rows written
+    """
 
-        kwargs['tweet_mode'] = 'extended'
-        count = 200
-        tweets = []
-        while True:
-            # Limit each GET to a maximum 200 tweets
-            kwargs['count'] = min(count, max_tweets - len(tweets)) if max_tweets else count
+    items = load_json_items(*shard)
+    if not items:
+        return 0
 
-            # To correctly traverse the user's timeline, set the
-            # max_id parameter after the first tweets are available.
-            # See https://dev.twitter.com/rest/public/timelines.
-            if tweets:
-                kwargs['max_id'] = min(tweet['id'] for tweet in results) - 1
+    if file_format == 'parquet':
+        import pandas
 
-            results = self.endpoint_request(endpoint, **kwargs)
-            if not results:
-                break
-            tweets.extend(results)
-            if max_tweets and len(tweets) >= max_tweets:
-                break
+        df = pandas.DataFrame(unpack_func(item) for item in items)
+        df.to_parquet(part_path, index=False)
+    else:
+        save_to_csv(items, unpack_func, part_path)
+    return len(items)
 
-        return tweets
 
-    def get_cursored_items(self, endpoint, key, count=5000, max_items=None, **kwargs):
-        """
-        Helper request function for cursored objects.
-        
-        :param endpoint: Endpoint request string, e.g. '/followers/ids'
-        :param key: Cursored items key, e.g. 'ids'
-        :param count: Maximum items per request
-        :param max_items: Maximum total items requested
-        :param kwargs: Optional, user-supplied keyword arguments
-        :return: A list of requested objects
-        """
+def merge_partitions(part_paths, path_or_buf, file_format='csv'):
+    """
+    Merge partition files, in the given order, into one output file.
 
-        kwargs['count'] = count
-        items = []
-        cursor = -1
-        while cursor:
-            kwargs['cursor'] = cursor
-            results = self.endpoint_request(endpoint, **kwargs)
-            if not results:
-                break
-            items.extend(results[key])
-            if max_items and len(items) >= max_items:
-                break
-            cursor = results['next_cursor']
+    :param part_paths: Ordered list of partition file paths
+    :param path_or_buf: String, output file path
+    :param file_format: 'csv' or 'parquet'
+    :return: None
+    """
 
-        return items
+    if file_format == 'parquet':
+        import pandas
 
-    def get_items_by_lookup(self, endpoint, item_keyword, items, **kwargs):
-        """
-        Get user-requested objects of type item_keyword, named in the items list.
-        
-        :param endpoint: Endpoint request string, e.g. '/users/lookup'
-        :param item_keyword: Endpoint request keyword
-               Note: Endpoint 'id' requests must call the twitter.Twitter()
-               API methods with kwargs['_id'] to produce correct results.
-        :param items: User-supplied list of requested items, e.g. screen names
-        :param kwargs: Optional, user-supplied keyword arguments
-        :return: A list of user-requested objects. Note: The Twitter API
-                 doesn't guarantee that objects are returned in the order
-                 requested. The caller is responsible for confirming the
-                 order and completeness of the returned list, if necessary.
-        """
+        frames = [pandas.read_parquet(part) for part in part_paths]
+        df = pandas.concat(frames, ignore_index=True) if frames else pandas.DataFrame()
+        df.to_parquet(path_or_buf, index=False)
+        return
 
-        # Request up to 100 items per call
-        items_max = 100
-        results = []
-        while items:
-            items_str = ','.join(str(item) for item in items[:items_max])
-            kwargs[item_keyword] = items_str
-            response = self.endpoint_request(endpoint, **kwargs)
-            if not response:
-                break
-            results.extend(response)
-            items = items[items_max:]
+    with open(path_or_buf, mode='w', encoding='utf-8-sig', newline='') as out:
+        for i, part in enumerate(part_paths):
+            with open(part, encoding='utf-8-sig', newline='') as f:
+                header = f.readline()
+                # Keep only the first partition's header row
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
 
-        return results
 
-    def get_rate_limits(self, key_0=None, key_1=None):
-        """
-        Query the authorized user's current rate limit data.
+def convert_json_archives(paths, path_or_buf, unpack_func=unpack_tweet,
+                          file_format='csv', processes=None,
+                          shard_bytes=64 * 1024 * 1024, parts_dir=None):
+    """
+    Convert raw JSON archives, e.g. files written by save_to_json(),
+    to a single CSV or Parquet file, unpacking shards of the input in
+    parallel worker processes. Partitions are merged in input order,
+    so the output is the same regardless of the number of processes.
+
+    Example:
+    convert_json_archives(glob.glob('archive/*.json'), 'tweets.csv')
+
+    :param paths: Iterable of JSON or JSON Lines (".jsonl") file paths
+    :param path_or_buf: String, output file path
+    :param unpack_func: Module-level function to extract select fields
+                        from individual Twitter objects; default unpack_tweet
+    :param file_format: 'csv' or 'parquet' (requires pyarrow or fastparquet)
+    :param processes: Worker processes; default os.cpu_count()
+    :param shard_bytes: Approximate JSON Lines shard size, in bytes
+    :param parts_dir: Optional directory to keep partition files;
+                      default temporary directory, removed when done
+    :return: Total rows written
+    """
 
-        See Rate Limits chart at https://dev.twitter.com/rest/public/rate-limits
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f'Unsupported file format: {file_format!r}')
 
-        :param key_0: Optional, single category request, e.g. 'statuses'
-        :param key_1: Optional, subcategory category request, e.g. '/statuses/user_timeline'
-        :return: Requested limits dictionary
-        """
+    shards = get_json_shards(paths, shard_bytes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parts_dir = parts_dir or tmp_dir
+        os.makedirs(parts_dir, exist_ok=True)
+        part_paths = [os.path.join(parts_dir, f'part-{i:05d}.{file_format}')
+                      for i in range(len(shards))]
 
-        limits = self.endpoint_request('/application/rate_limit_status')
-        if limits:
-            limits = limits['resources']
-            if key_0 in limits:
-                limits = limits[key_0]
-                return limits[key_1] if key_1 else limits
-            else:
-                return limits
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            counts = list(executor.map(convert_json_shard, shards,
+                                       itertools.repeat(unpack_func),
+                                       part_paths,
+                                       itertools.repeat(file_format)))
 
-        return None
+        merge_partitions([part for part, count in zip(part_paths, counts) if count],
+                         path_or_buf, file_format)
+
+    return sum(counts)
+
+
+# --- Define classes --- #
+
+
+class ProfileTable(dict):
+    """
+    Deduplicated table of Twitter user objects, keyed by user id_str.
+
+    Every tweet embeds a full user object, so a prolific author is
+    repeated in every one of their tweets. Interning a tweet moves its
+    user object into the table and leaves behind a reference holding
+    only the user's id_str and screen_name, which is all unpack_tweet()
+    needs. The table keeps the freshest copy of each user.
+    """
+
+    # Keys kept in the reference left in an interned tweet
+    reference_keys = ('id_str', 'screen_name')
+
+    # Tweet keys holding nested tweets with their own embedded users
+    nested_keys = ('retweeted_status', 'quoted_status')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Freshness of each stored user object, by user id_str; see is_fresher()
+        self.seen = {}
 
-    def get_home_timeline(self, max_tweets=None):
+    @staticmethod
+    def is_fresher(profile, seen, current, current_seen):
         """
-        Get a list of the most recent tweets and retweets posted
-        by the authenticating user and the user's friends (following).        
-        
-        :param max_tweets: Optional maximum tweets requested
-        :return: List of tweets
+        Decide whether a user object is at least as fresh as the stored one.
+        User objects carry no snapshot time, so they are dated by the ID
+        of the tweet they were embedded in, as tweet IDs grow over time:
+        a user from a later tweet is fresher. Users from the same tweet
+        are compared by statuses_count. A user without a tweet, e.g. from
+        get_user_profiles(), can't be dated, so the last one seen wins.
+
+        :param profile: Candidate Twitter User object
+        :param seen: Candidate's embedding tweet ID, or None
+        :param current: Stored Twitter User object
+        :param current_seen: Stored object's embedding tweet ID, or None
+        :return: True if profile should replace current
         """
 
-        return self.get_user_tweets('/statuses/home_timeline', max_tweets)
+        if seen is None or current_seen is None:
+            return True
+        if seen != current_seen:
+            return seen > current_seen
+        return (profile.get('statuses_count') or 0) >= (current.get('statuses_count') or 0)
 
-    def get_user_timeline(self, screen_name=None, user_id=None, max_tweets=None):
+    def is_reference(self, user):
         """
-        Get a list of the most recent tweets posted by the user specified
-        by screen_name or user_id. If both screen_name and user_id are given,
-        screen_name is used. If neither screen_name nor user_id is given,
-        results are collected for the authenticated user.        
-        
-        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
-        :param user_id: User's numeric ID
-        :param max_tweets: Maximum desired tweets
-        :return: List of tweets
+        :param user: Embedded tweet user object
+        :return: True if user is a reference left by intern()
         """
 
-        return self.get_user_tweets('/statuses/user_timeline', screen_name, user_id, max_tweets)
+        return user.keys() <= set(self.reference_keys)
 
-    def get_user_favorites(self, screen_name=None, user_id=None, max_tweets=None):
+    def add(self, profile, seen=None):
         """
-        Get a list of the most recent tweets favorited by the authenticating
-        user, or the user specified by screen_name or user_id. If both screen_name
-        and user_id are given, screen_name is used. If neither screen_name nor user_id
-        is given, results are collected for the authenticated user.
-        
-        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
-        :param user_id: User's numeric ID
-        :param max_tweets: Maximum desired tweets
-        :return: List of tweets
+        Add a user object to the table, keeping the freshest copy.
+
+        :param profile: Twitter User object
+        :param seen: Optional ID of the tweet the user was embedded in
+        :return: The stored user object
         """
 
-        return self.get_user_tweets('/favorites/list', screen_name, user_id, max_tweets)
+        key = profile['id_str']
+        current = self.get(key)
+        if current is None or self.is_fresher(profile, seen, current, self.seen.get(key)):
+            self[key] = profile
+            self.seen[key] = seen
+            return profile
+        return current
 
-    def get_user_profiles(self, screen_names=None, user_ids=None):
+    def intern(self, tweet, seen=None):
         """
-        Get a list of user objects as specified by values given by the screen_names
-        or user_ids list parameter. If both lists, screen_names and user_ids,
-        are given, screen_names is used.
-        
-        :param screen_names: List of user screen names, a.k.a. handles
-        :param user_ids: List of user numeric IDs
-        :return: List of user objects
+        Move the tweet's embedded user objects, including those of any
+        retweeted or quoted tweet, into the table. The tweet is modified
+        in place.
+
+        :param tweet: Twitter Tweet object
+        :param seen: ID of the outermost tweet, used to date nested
+                     tweets' users, which were collected with it;
+                     default this tweet's ID
+        :return: The interned tweet
         """
 
-        items = screen_names or user_ids
-        item_keyword = 'screen_name' if screen_names else 'user_id'
-        return self.get_items_by_lookup('/users/lookup', item_keyword, items)
+        if seen is None:
+            seen = tweet.get('id')
+
+        user = tweet.get('user')
+        if user and not self.is_reference(user):
+            self.add(user, seen)
+            tweet['user'] = {key: user.get(key) for key in self.reference_keys}
+
+        for key in self.nested_keys:
+            nested = tweet.get(key)
+            if nested:
+                self.intern(nested, seen)
+
+        return tweet
 
-    def get_tweets_by_id(self, ids, **kwargs):
+    def intern_tweets(self, tweets):
         """
-        Get a list of tweets, specified by a given list of
-        numeric Tweet IDs in parameter ids.
-        
-        :param ids: List of unique numeric tweet IDs
-        :return: List of requested tweets
+        Intern tweets as they are consumed, e.g. from a stream of results.
+
+        :param tweets: Iterable of tweet objects
+        :return: Generator of interned tweets
         """
 
-        kwargs['tweet_mode'] = 'extended'
-        return self.get_items_by_lookup('/statuses/lookup', '_id', ids, **kwargs)
+        for tweet in tweets:
+            yield self.intern(tweet)
 
-    def get_connection_ids(self, which='friends', screen_name=None, user_id=None,
-                           max_ids=None, **kwargs):
+    def resolve(self, tweet):
         """
-        For the user specified by screen_name or user_id, get a list of user IDs
-        for every user the specified user is following (which="friends"), or
-        for every user following the specified user (which=followers"). If both
-        screen_name and user_id are given, screen_name is used.  
-        :param which: Connection type, Friends or Followers
-        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
-        :param user_id: User's numeric ID
-        :param max_ids: Maximum IDs to request
-        :param kwargs: Optional, user-supplied keyword arguments
-        :return: List of user IDs
+        Restore the full user objects in an interned tweet, in place.
+        Users missing from the table keep their references.
+
+        :param tweet: Interned Twitter Tweet object
+        :return: The resolved tweet
         """
 
-        endpoint = {'friends': '/friends/ids',
-                    'followers': '/followers/ids'}.get(which)
-        # No screen_name or user_id implies default to authenticated user
-        if screen_name:
-            kwargs['screen_name'] = screen_name
+        user = tweet.get('user')
+        if user and self.is_reference(user):
+            tweet['user'] = self.get(user['id_str'], user)
+
+        for key in self.nested_keys:
+            nested = tweet.get(key)
+            if nested:
+                self.resolve(nested)
+
+        return tweet
+
+
+class TweetIndex:
+    """
+    On-disk inverted index over collected tweets, stored in SQLite.
+
+    Each tweet is indexed under the terms returned by get_index_terms(),
+    e.g. '#hashtag', '@mention', '$symbol', 'domain:nytimes.com' or a
+    lowercase word, with posting lists of tweet IDs. Tweets can be added
+    as they're collected, and queried without requesting them again.
+
+    Example:
+    index = TweetIndex('tweets.db')
+    index.add(twt.search_tweets('#python'))
+    # Tweets with #python, mentioning @ThePSF or @gvanrossum, since June 1
+    ids = index.search('#python', ['@thepsf', '@gvanrossum'], since='2019-06-01T00:00:00Z')
+    tweets = index.get_tweets(ids)
+    """
+
+    def __init__(self, path, store_tweets=True):
+        """
+        :param path: SQLite database file path; created if necessary
+        :param store_tweets: Store each tweet's JSON, for get_tweets();
+                             default True
+        """
+
+        import sqlite3
+
+        self.path = path
+        self.store_tweets = store_tweets
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS tweets '
+                        '(id INTEGER PRIMARY KEY, created TEXT, tweet TEXT)')
+        # Postings are clustered by term, then tweet ID, so each term's
+        # posting list, or a time range of it, is one range scan.
+        self.db.execute('CREATE TABLE IF NOT EXISTS postings '
+                        '(term TEXT, id INTEGER, PRIMARY KEY (term, id)) WITHOUT ROWID')
+        self.db.commit()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM tweets').fetchone()[0]
+
+    def add(self, tweets):
+        """
+        Index tweets; tweets already in the index are skipped.
+
+        :param tweets: Iterable of tweet objects
+        :return: Number of tweets added
+        """
+
+        tweets = list(tweets)
+        with self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                'INSERT OR IGNORE INTO tweets VALUES (?, ?, ?)',
+                ((int(tweet['id_str']),
+                  format_datetime(get_data(tweet, 'created_at')),
+                  json.dumps(tweet) if self.store_tweets else None)
+                 for tweet in tweets))
+            added = self.db.total_changes - before
+
+            # Postings are idempotent, so re-adding a tweet changes nothing
+            self.db.executemany(
+                'INSERT OR IGNORE INTO postings VALUES (?, ?)',
+                ((term, int(tweet['id_str']))
+                 for tweet in tweets for term in get_index_terms(tweet)))
+
+        return added
+
+    def search(self, *groups, since=None, until=None, limit=None):
+        """
+        Find tweets matching every group of terms. A group is a single
+        term, or a list of alternative terms of which any may match.
+        Terms are matched case-insensitively; see get_index_terms().
+
+        :param groups: Terms or lists of terms
+        :param since: Optional earliest creation time, inclusive;
+                      datetime.datetime or ISO 8601 string
+        :param until: Optional latest creation time, exclusive;
+                      datetime.datetime or ISO 8601 string
+        :param limit: Optional maximum number of tweet IDs
+        :return: List of matching tweet IDs, newest first
+        """
+
+        if not groups:
+            return []
+
+        # Tweet IDs are ordered by time, so time filters are ID ranges
+        low = get_snowflake_id(since) if since else 0
+        high = get_snowflake_id(until) - 1 if until else 2 ** 63 - 1
+
+        selects = []
+        params = []
+        for group in groups:
+            terms = [group] if isinstance(group, str) else list(group)
+            placeholders = ', '.join('?' * len(terms))
+            selects.append(f'SELECT id FROM postings '
+                           f'WHERE term IN ({placeholders}) AND id BETWEEN ? AND ?')
+            params.extend(term.lower() for term in terms)
+            params.extend((low, high))
+
+        sql = ' INTERSECT '.join(selects) + ' ORDER BY id DESC'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        return [row[0] for row in self.db.execute(sql, params)]
+
+    def get_tweets(self, ids):
+        """
+        Get stored tweets by ID, in the order given. IDs of tweets not
+        stored (e.g. indexed with store_tweets=False) are skipped.
+
+        :param ids: Iterable of tweet IDs
+        :return: List of tweet objects
+        """
+
+        tweets = []
+        for tweet_id in ids:
+            row = self.db.execute('SELECT tweet FROM tweets WHERE id = ?',
+                                  (int(tweet_id),)).fetchone()
+            if row and row[0]:
+                tweets.append(json.loads(row[0]))
+        return tweets
+
+    def close(self):
+        self.db.close()
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: approximate counts of keys in a stream, in fixed
+    memory. Estimates never undercount; with width w and depth d, an
+    estimate exceeds the true count by more than 2.72 / w of the total
+    count with probability at most 0.37 ** d. Sketches of equal size
+    can be merged, e.g. to combine results from parallel workers.
+    """
+
+    def __init__(self, width=2048, depth=5):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.width!r}, {self.depth!r})'
+
+    def columns(self, key):
+        """
+        :param key: String key
+        :return: List of the key's column in each row
+        """
+
+        # Derive each row's hash from two independent 64-bit hashes
+        h1, h2 = get_key_hashes(key)
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        """
+        :param key: String key
+        :param count: Count to add; default 1
+        :return: The key's updated count estimate
+        """
+
+        self.total += count
+        estimate = None
+        for row, column in zip(self.rows, self.columns(key)):
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        return estimate
+
+    def estimate(self, key):
+        """
+        :param key: String key
+        :return: The key's count estimate
+        """
+
+        return min(row[column] for row, column in zip(self.rows, self.columns(key)))
+
+    def merge(self, other):
+        """
+        Add another sketch's counts to this sketch.
+
+        :param other: CountMinSketch of the same width and depth
+        :return: This sketch
+        """
+
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('Sketch sizes differ')
+        self.total += other.total
+        for row, other_row in zip(self.rows, other.rows):
+            row[:] = [a + b for a, b in zip(row, other_row)]
+        return self
+
+
+class TopK:
+    """
+    Heavy hitters: the approximately most frequent keys in a stream,
+    tracked as a bounded set of candidates counted by a count-min sketch.
+    Mergeable, like CountMinSketch.
+    """
+
+    def __init__(self, k=20, width=2048, depth=5):
+        self.k = k
+        # Track extra candidates so keys near the cutoff aren't lost
+        self.capacity = 4 * k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self.threshold = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.k!r})'
+
+    def add(self, key, count=1):
+        """
+        :param key: String key
+        :param count: Count to add; default 1
+        :return: None
+        """
+
+        estimate = self.sketch.add(key, count)
+        if key in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[key] = estimate
+            return
+
+        # Candidate estimates only grow, so a key at or below the last
+        # known minimum can't displace a candidate; skip the search.
+        if estimate <= self.threshold:
+            return
+
+        smallest = min(self.candidates, key=self.candidates.get)
+        self.threshold = self.candidates[smallest]
+        if estimate > self.threshold:
+            del self.candidates[smallest]
+            self.candidates[key] = estimate
+
+    def merge(self, other):
+        """
+        Add another TopK's counts to this one.
+
+        :param other: TopK with sketch of the same width and depth
+        :return: This TopK
+        """
+
+        self.sketch.merge(other.sketch)
+        keys = set(self.candidates) | set(other.candidates)
+        estimates = {key: self.sketch.estimate(key) for key in keys}
+        self.candidates = dict(sorted(estimates.items(), key=lambda item: -item[1])[:self.capacity])
+        self.threshold = 0
+        return self
+
+    def top(self, n=None):
+        """
+        :param n: Number of keys; default k
+        :return: List of (key, count estimate) tuples, most frequent first
+        """
+
+        ranked = sorted(self.candidates.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:n or self.k]
+
+
+class HyperLogLog:
+    """
+    HyperLogLog: approximate count of distinct keys in a stream, in
+    2 ** p bytes, with relative standard error about 1.04 / sqrt(2 ** p),
+    e.g. 0.8% for the default p=14. Mergeable, like CountMinSketch.
+    """
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = bytearray(2 ** p)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.p!r})'
+
+    def __len__(self):
+        return round(self.estimate())
+
+    def add(self, key):
+        """
+        :param key: String key
+        :return: None
+        """
+
+        h = get_key_hashes(key)[0]
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1 bit in the remaining 64 - p bits
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        """
+        :return: Distinct key count estimate
+        """
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Use linear counting for small cardinalities
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+    def merge(self, other):
+        """
+        Add another HyperLogLog's keys to this one.
+
+        :param other: HyperLogLog with the same p
+        :return: This HyperLogLog
+        """
+
+        if self.p != other.p:
+            raise ValueError('HyperLogLog sizes differ')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+
+class TweetStats:
+    """
+    Streaming statistics over tweets, in bounded memory: top hashtags,
+    mentions, expanded URL domains and languages, and the number of
+    distinct users. Stats from parallel workers can be merged. Updates
+    are thread-safe, so one TweetStats can observe several threads.
+
+    Example:
+    stats = TweetStats()
+    twt.tweet_observers.append(stats.update)
+    for query in queries:
+        twt.search_tweets(query)
+    pprint.pprint(stats.report())
+    """
+
+    fields = ('hashtags', 'mentions', 'domains', 'languages')
+
+    def __init__(self, k=20, width=2048, depth=5, p=14):
+        self.tweets = 0
+        self.hashtags = TopK(k, width, depth)
+        self.mentions = TopK(k, width, depth)
+        self.domains = TopK(k, width, depth)
+        self.languages = TopK(k, width, depth)
+        self.users = HyperLogLog(p)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(tweets={self.tweets!r})'
+
+    def __getstate__(self):
+        # Locks can't be pickled, e.g. to send stats between processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def update(self, tweets):
+        """
+        Add tweets to the statistics.
+
+        :param tweets: Iterable of tweet objects
+        :return: None
+        """
+
+        with self.lock:
+            for tweet in tweets:
+                self.tweets += 1
+                entities = tweet.get('entities') or {}
+                for hashtag in entities.get('hashtags') or ():
+                    self.hashtags.add(hashtag['text'].lower())
+                for mention in entities.get('user_mentions') or ():
+                    self.mentions.add(mention['screen_name'].lower())
+                for url in entities.get('urls') or ():
+                    with suppress(ValueError):
+                        host = urllib.parse.urlsplit(url.get('expanded_url') or '').hostname
+                        if host:
+                            self.domains.add(re.sub(r'^www\.', '', host))
+                if tweet.get('lang'):
+                    self.languages.add(tweet['lang'])
+                user_id = get_data(tweet, 'user', 'id_str')
+                if user_id:
+                    self.users.add(user_id)
+
+    def merge(self, other):
+        """
+        Add another TweetStats' statistics to this one.
+
+        :param other: TweetStats with the same sketch sizes,
+                      no longer being updated
+        :return: This TweetStats
+        """
+
+        with self.lock:
+            self.tweets += other.tweets
+            for field in self.fields:
+                getattr(self, field).merge(getattr(other, field))
+            self.users.merge(other.users)
+        return self
+
+    def report(self, n=None):
+        """
+        :param n: Number of top keys per field; default k
+        :return: Dictionary of tweet count, distinct user estimate,
+                 and (key, count estimate) lists per field
+        """
+
+        with self.lock:
+            report = {'tweets': self.tweets, 'users': len(self.users)}
+            report.update((field, getattr(self, field).top(n)) for field in self.fields)
+        return report
+
+
+class RetryLater(Exception):
+    """
+    Raised by a non-blocking TwitterTools object when a request's endpoint
+    is rate limited or failing. The request may be retried at retry_at.
+    """
+
+    def __init__(self, endpoint, retry_at):
+        """
+        :param endpoint: Endpoint request string, e.g. '/search/tweets'
+        :param retry_at: Earliest retry time, in seconds since the epoch
+        """
+
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+        # FetchProgress of the interrupted multi-request fetch, if any
+        self.progress = None
+        super().__init__(f'Retry "{endpoint}" after '
+                         f'{datetime.datetime.fromtimestamp(retry_at):%Y-%m-%d %H:%M:%S}')
+
+
+class FetchProgress:
+    """
+    Progress of a multi-request fetch, e.g. search_tweets(): the items
+    received so far, and the state needed to request the rest. When a
+    non-blocking fetch raises RetryLater, its progress is attached to
+    the exception; passing it back as the fetch's progress argument
+    resumes the fetch without repeating requests already made.
+    RetryQueue does this automatically.
+    """
+
+    def __init__(self):
+        self.items = []
+        # Fetch-specific state, e.g. the next cursor or max_id
+        self.state = {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(items={len(self.items)}, state={self.state!r})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Outer fetches exit last, so the outermost fetch's progress is kept
+        if isinstance(exc, RetryLater):
+            exc.progress = self
+        return False
+
+
+class ListMembersError(Exception):
+    """
+    Raised when a batch of list member changes fails. Users in earlier
+    batches were changed; done and failed list the users changed and
+    not changed, so the caller can reconcile.
+    """
+
+    def __init__(self, endpoint, done, failed):
+        """
+        :param endpoint: Endpoint request string, e.g. '/lists/members/create_all'
+        :param done: Users in batches that succeeded
+        :param failed: Users in the failed batch and any later batches
+        """
+
+        self.endpoint = endpoint
+        self.done = done
+        self.failed = failed
+        # Changes made before the failure, set by sync_list_members()
+        self.result = None
+        super().__init__(f'Request to "{endpoint}" failed; '
+                         f'{len(done)} users changed, {len(failed)} not changed')
+
+
+class MediaUploadError(Exception):
+    """
+    Raised when a media file can't be uploaded or processed.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker. Rate limit or server errors open the
+    breaker, deferring requests until it closes: at the endpoint's rate
+    limit reset time, or after a jittered backoff that grows 1.5x with
+    each consecutive server error. A success resets the backoff.
+    """
+
+    # Rate limit window, used when the reset time isn't reported
+    rate_limit_wait = 60 * 15
+    # Minimum wait after a rate limit error, whatever the reset time
+    min_rate_limit_wait = 60
+    # Give up after server errors when the backoff reaches this many seconds
+    max_backoff = 60 * 30
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.failures = 0
+        self.open_until = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.endpoint!r})'
+
+    def wait_time(self):
+        """
+        :return: Seconds until the breaker closes; 0 if closed
+        """
+
+        return max(self.open_until - time.time(), 0)
+
+    def record_success(self):
+        """
+        Reset the backoff after a successful request.
+
+        :return: None
+        """
+
+        self.failures = 0
+
+    def record_rate_limit(self, reset=None):
+        """
+        Open the breaker until the rate limit resets.
+
+        :param reset: Optional rate limit reset time, in seconds since
+                      the epoch, e.g. from the x-rate-limit-reset header
+        :return: None
+        """
+
+        now = time.time()
+        with suppress(TypeError, ValueError):
+            # Allow a little slack for clock differences, but don't trust
+            # a reset time that's past, or beyond the next window
+            reset = float(reset) + random.uniform(1, 5)
+            self.open_until = min(max(reset, now + self.min_rate_limit_wait),
+                                  now + self.rate_limit_wait)
+            return
+        self.open_until = now + self.rate_limit_wait
+
+    def record_failure(self):
+        """
+        Open the breaker for a jittered backoff after a server error.
+
+        :return: False if the backoff has reached max_backoff and the
+                 request should be abandoned, else True
+        """
+
+        backoff = 1.5 ** self.failures
+        if backoff >= self.max_backoff:
+            self.failures = 0
+            return False
+
+        self.failures += 1
+        # Randomize the wait so clients don't retry in lockstep
+        self.open_until = time.time() + random.uniform(backoff / 2, backoff)
+        return True
+
+
+class RetryQueue:
+    """
+    Deferred-retry queue for a non-blocking TwitterTools object. Each
+    submitted call that raises RetryLater is set aside until its retry
+    time while other calls keep running, so a throttled endpoint doesn't
+    hold up requests to other endpoints. The queue sleeps only when every
+    pending call is waiting.
+
+    A deferred call to a multi-request method with a progress argument,
+    e.g. search_tweets(), resumes where it stopped; see FetchProgress.
+    Other calls are retried from the start.
+
+    Example:
+    twt = TwitterTools(credentials, blocking=False)
+    queue = RetryQueue()
+    searches = [queue.submit(twt.search_tweets, query) for query in queries]
+    profiles = queue.submit(twt.get_user_profiles, screen_names)
+    queue.run()
+    tweets = [future.result() for future in searches]
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.count = itertools.count()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, func, *args, retry_at=0, **kwargs):
+        """
+        Add a call to the queue.
+
+        :param func: Function or method to call
+        :param args: Positional arguments
+        :param retry_at: Earliest call time, in seconds since the epoch;
+                         default now
+        :param kwargs: Keyword arguments
+        :return: concurrent.futures.Future for the call's result
+        """
+
+        import heapq
+
+        future = concurrent.futures.Future()
+        heapq.heappush(self.pending, (retry_at, next(self.count), func, args, kwargs, future))
+        return future
+
+    @staticmethod
+    def accepts_progress(func):
+        """
+        :param func: Function or method
+        :return: True if func takes a progress argument, to resume with
+        """
+
+        import inspect
+
+        try:
+            return 'progress' in inspect.signature(func).parameters
+        except (TypeError, ValueError):
+            return False
+
+    def run_ready(self):
+        """
+        Make the calls that are due, deferring those that raise RetryLater.
+
+        :return: Seconds until the next deferred call is due,
+                 or None if the queue is empty
+        """
+
+        import heapq
+
+        while self.pending and self.pending[0][0] <= time.time():
+            _, _, func, args, kwargs, future = heapq.heappop(self.pending)
+            try:
+                future.set_result(func(*args, **kwargs))
+            except RetryLater as e:
+                if e.progress is not None and self.accepts_progress(func):
+                    kwargs = dict(kwargs, progress=e.progress)
+                heapq.heappush(self.pending, (e.retry_at, next(self.count),
+                                              func, args, kwargs, future))
+            except Exception as e:
+                future.set_exception(e)
+
+        return max(self.pending[0][0] - time.time(), 0) if self.pending else None
+
+    def run(self):
+        """
+        Make all queued calls, sleeping only while every call is deferred.
+
+        :return: None
+        """
+
+        while True:
+            wait = self.run_ready()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+
+class LookupBatcher:
+    """
+    Merge concurrent lookups, e.g. users by screen name from several
+    threads, into shared requests of up to 100 items. The first caller
+    to add an item to a new batch sends it, after waiting up to window
+    seconds for other callers to fill it; a full batch is sent at once.
+    Items already in a pending or in-flight batch aren't requested again.
+
+    Items are normalized as the API matches them, so ' 0123' and 123
+    are the same user ID, and screen names are case-insensitive; the
+    normalized items are sent.
+    """
+
+    items_max = 100
+
+    def __init__(self, send, window=0.02):
+        """
+        :param send: Function taking endpoint, item_keyword, a list of items
+                     and keyword arguments, returning a list of objects;
+                     e.g. TwitterTools.send_lookup
+        :param window: Seconds a new batch waits for more items
+        """
+
+        self.send = send
+        self.window = window
+        self.lock = threading.Lock()
+        # Open batches, by lookup key
+        self.open = {}
+        # Open and in-flight batches, by (lookup key, item key)
+        self.pending = {}
+
+    @staticmethod
+    def get_item_key(item_keyword, item):
+        """
+        :param item_keyword: Endpoint request keyword
+        :param item: Requested item, e.g. screen name or ID
+        :return: Normalized item key: a lowercase screen name, or an ID
+                 without whitespace or leading zeros
+        """
+
+        item = str(item).strip()
+        if item_keyword == 'screen_name':
+            return item.lower()
+        return str(int(item)) if item.isdigit() else item
+
+    @staticmethod
+    def get_result_key(item_keyword, result):
+        """
+        :param item_keyword: Endpoint request keyword
+        :param result: Returned Twitter User or Tweet object
+        :return: Item key for the object, matching get_item_key()
+        """
+
+        if item_keyword == 'screen_name':
+            return result['screen_name'].lower()
+        return result['id_str']
+
+    def lookup(self, endpoint, item_keyword, items, kwargs):
+        """
+        Look up items, sharing requests with concurrent callers.
+
+        :param endpoint: Endpoint request string, e.g. '/users/lookup'
+        :param item_keyword: Endpoint request keyword
+        :param items: List of requested items
+        :param kwargs: Keyword arguments dictionary
+        :return: List of requested objects found, without duplicates
+        """
+
+        if not items:
+            return []
+
+        key = TwitterTools.get_request_key(endpoint, (item_keyword,), kwargs)
+        wanted = []
+        leading = []
+        with self.lock:
+            for item in items:
+                item_key = self.get_item_key(item_keyword, item)
+                batch = self.pending.get((key, item_key))
+                if batch is None:
+                    batch = self.open.get(key)
+                    if batch is None:
+                        batch = self.open[key] = LookupBatch()
+                        leading.append(batch)
+                    batch.items.append(item_key)
+                    self.pending[(key, item_key)] = batch
+                    if len(batch.items) >= self.items_max:
+                        del self.open[key]
+                        batch.full.set()
+                wanted.append((item_key, batch))
+
+        for batch in leading:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.open.get(key) is batch:
+                    del self.open[key]
+                batch_items = list(batch.items)
+            try:
+                for result in self.send(endpoint, item_keyword, batch_items, **kwargs):
+                    batch.results[self.get_result_key(item_keyword, result)] = result
+            except Exception as e:
+                batch.error = e
+            finally:
+                with self.lock:
+                    for item_key in batch.items:
+                        self.pending.pop((key, item_key), None)
+                batch.done.set()
+
+        import copy
+
+        results = {}
+        for item_key, batch in wanted:
+            batch.done.wait()
+            if isinstance(batch.error, RetryLater):
+                # A fetch attaches its own progress to RetryLater, so don't share it
+                raise RetryLater(batch.error.endpoint, batch.error.retry_at) from None
+            if batch.error:
+                raise batch.error
+            if item_key in batch.results:
+                result = batch.results[item_key]
+                # Callers may modify their objects, so only the sender gets the originals
+                results[item_key] = result if batch in leading else copy.deepcopy(result)
+        return list(results.values())
+
+
+class LookupBatch:
+    """
+    A batch of up to 100 lookup items, shared by LookupBatcher callers.
+    """
+
+    def __init__(self):
+        # Requested item keys, and returned objects by item key
+        self.items = []
+        self.results = {}
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class TwitterTools:
+    """
+    twittertools Twitter API class
+    """
+
+    # Read-only endpoints whose identical concurrent requests are coalesced
+    coalesced_endpoints = {'/application/rate_limit_status',
+                           '/favorites/list',
+                           '/followers/ids',
+                           '/friends/ids',
+                           '/lists/members',
+                           '/search/tweets',
+                           '/statuses/home_timeline',
+                           '/statuses/user_timeline',
+                           '/statuses/lookup',
+                           '/trends/available',
+                           '/trends/closest',
+                           '/trends/place',
+                           '/users/lookup'}
+
+    # Seconds a lookup batch waits for concurrent lookups to join it
+    lookup_window = 0.02
+
+    def __init__(self, credentials_file, blocking=True,
+                 upload_domain='upload.twitter.com', upload_secure=True):
+        """
+        :param credentials_file: Twitter application credentials JSON file name.
+        :param blocking: If True (default), wait out rate limits and server
+                         errors. If False, raise RetryLater instead; see
+                         endpoint_request() and RetryQueue.
+        :param upload_domain: Media upload API domain; default 'upload.twitter.com'
+        :param upload_secure: Use HTTPS for media uploads; default True
+        """
+
+        self.credentials = credentials_file
+        self.blocking = blocking
+        # Per-endpoint CircuitBreaker objects, by endpoint request string
+        self.breakers = {}
+        # Functions called with each page of tweets as it's received,
+        # e.g. TweetStats.update, for streaming aggregation
+        self.tweet_observers = []
+        # Thread pool for background media uploads, created on first use
+        self.media_executor = None
+        # In-flight request futures, by request key, for coalescing
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+        self.lookup_batcher = LookupBatcher(self.send_lookup, self.lookup_window)
+        self.api = get_api(self.credentials)
+        self.upload_api = get_api(self.credentials, upload_domain, upload_secure)
+        if self.api:
+            self.api_endpoint_method = {
+                '/application/rate_limit_status': self.api.application.rate_limit_status,
+                '/favorites/list': self.api.favorites.list,
+                '/followers/ids': self.api.followers.ids,
+                '/friends/ids': self.api.friends.ids,
+                '/lists/create': self.api.lists.create,
+                '/lists/members': self.api.lists.members,
+                '/lists/members/create': self.api.lists.members.create,
+                '/lists/members/create_all': self.api.lists.members.create_all,
+                '/lists/members/destroy_all': self.api.lists.members.destroy_all,
+                '/media/upload': self.upload_api.media.upload,
+                '/search/tweets': self.api.search.tweets,
+                '/statuses/home_timeline': self.api.statuses.home_timeline,
+                '/statuses/user_timeline': self.api.statuses.user_timeline,
+                '/statuses/lookup': self.api.statuses.lookup,
+                '/statuses/update': self.api.statuses.update,
+                '/trends/available': self.api.trends.available,
+                '/trends/closest': self.api.trends.closest,
+                '/trends/place': self.api.trends.place,
+                '/users/lookup': self.api.users.lookup
+            }
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.credentials!r})'
+
+    def observe_tweets(self, tweets):
+        """
+        Pass received tweets to each function in self.tweet_observers.
+
+        :param tweets: List of tweet objects
+        :return: None
+        """
+
+        for observer in self.tweet_observers:
+            observer(tweets)
+
+    def get_breaker(self, endpoint):
+        """
+        Get the endpoint's circuit breaker, creating it if necessary.
+
+        :param endpoint: Endpoint request string, e.g. '/search/tweets'
+        :return: CircuitBreaker object
+        """
+
+        return self.breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+
+    @staticmethod
+    def get_request_key(endpoint, args, kwargs):
+        """
+        Build a hashable key identifying a request, normalizing keyword
+        argument order and value types, e.g. woeid 1 and '1'.
+
+        :param endpoint: Endpoint request string, e.g. '/trends/place'
+        :param args: Positional arguments
+        :param kwargs: Keyword arguments
+        :return: Request key tuple
+        """
+
+        return (endpoint,
+                tuple(str(arg) for arg in args),
+                tuple(sorted((key, str(value)) for key, value in kwargs.items())))
+
+    def endpoint_request(self, endpoint, *args, **kwargs):
+        """
+        Send Twitter API requests (e.g. GET, POST), handle request errors,
+        and return requested Twitter content.
+
+        Identical concurrent requests to read-only endpoints (those in
+        coalesced_endpoints) are coalesced: while one request is in
+        flight, other threads making the same request wait for it and
+        share its response, rather than spending rate limit quota.
+        Each waiting thread gets its own copy of the response.
+
+        :param endpoint: Endpoint request string, e.g. '/search/tweets'
+        :param args: Optional, user-supplied positional arguments
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: Twitter content, defined by endpoint request.
+        """
+
+        if endpoint not in self.coalesced_endpoints:
+            return self.send_request(endpoint, *args, **kwargs)
+
+        key = self.get_request_key(endpoint, args, kwargs)
+        with self.inflight_lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = concurrent.futures.Future()
+
+        if not leader:
+            import copy
+
+            try:
+                response = future.result()
+            except RetryLater as e:
+                # A fetch attaches its own progress to RetryLater, so don't share it
+                raise RetryLater(e.endpoint, e.retry_at) from None
+            # The leader's caller may modify its response, e.g. ProfileTable.intern()
+            return copy.deepcopy(response)
+
+        try:
+            response = self.send_request(endpoint, *args, **kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+
+    def send_request(self, endpoint, *args, **kwargs):
+        """
+        Send Twitter API requests (e.g. GET, POST), handle request errors,
+        and return requested Twitter content.
+
+        Rate limit (429) and server (5xx) errors open the endpoint's
+        circuit breaker, deferring further requests to that endpoint
+        only. A blocking TwitterTools object waits for the breaker to
+        close; otherwise, RetryLater is raised so the caller can get
+        on with other work and retry the request later.
+
+        :param endpoint: Endpoint request string, e.g. '/search/tweets'
+        :param args: Optional, user-supplied positional arguments
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: Twitter content, defined by endpoint request.
+        """
+
+        def handle_http_error(error, endpoint, breaker):
+            """
+            Handle common twitter.api.TwitterHTTPError(s)
+
+            :param error: twitter.api.TwitterHTTPError error object
+            :param endpoint: Endpoint request string, e.g. '/search/tweets'
+            :param breaker: The endpoint's CircuitBreaker object
+            :return: True if the request should be retried
+            """
+
+            # See https://dev.twitter.com/docs/error-codes-responses
+
+            errors = {401: '(Unauthorized)',
+                      403: '(Forbidden)',
+                      404: '(Not Found)',
+                      429: '(Rate Limit Exceeded)',
+                      500: '(Internal Server Error)',
+                      502: '(Bad Gateway)',
+                      503: '(Service Unavailable)',
+                      504: '(Gateway Timeout)'
+                      }
+
+            ecode = error.e.code
+            now = f'{datetime.datetime.now():%Y-%m-%d %H:%M:%S}'
+            descr = errors.get(ecode, "(Unknown)")
+            print(f'{now}: Error {ecode} {descr} on "{endpoint}"', file=sys.stderr, flush=True)
+
+            if ecode in (401, 403, 404):
+                # Caller must handle these errors.
+                return False
+
+            if ecode == 429:
+                headers = getattr(error.e, 'headers', None) or {}
+                breaker.record_rate_limit(headers.get('x-rate-limit-reset'))
+                return True
+
+            if ecode in (500, 502, 503, 504):
+                if breaker.record_failure():
+                    return True
+                print('Too many retries. Quitting.', file=sys.stderr)
+
+            raise error
+
+        # def handle_http_error
+
+        import twitter
+
+        api_endpoint = self.api_endpoint_method[endpoint]
+        breaker = self.get_breaker(endpoint)
+
+        while True:
+            wait = breaker.wait_time()
+            if wait:
+                if not self.blocking:
+                    raise RetryLater(endpoint, breaker.open_until)
+                print(f'Retrying "{endpoint}" in {wait:.0f} seconds...', end=' ',
+                      file=sys.stderr, flush=True)
+                time.sleep(wait)
+                print('awake and trying again.', file=sys.stderr)
+
+            try:
+                response = api_endpoint(*args, **kwargs)
+            except twitter.api.TwitterHTTPError as e:
+                if handle_http_error(e, endpoint, breaker):
+                    continue
+                return None
+
+            breaker.record_success()
+            return response
+
+    def get_user_tweets(self, endpoint, screen_name=None, user_id=None,
+                        max_tweets=None, progress=None, **kwargs):
+        """
+        Request a user's tweets (statuses) according to the endpoint
+
+        :param endpoint: Endpoint request string, e.g. '/statuses/user_timeline'
+        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
+        :param user_id: User's numeric ID
+        :param max_tweets: Maximum tweets requested
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: A list of Tweet objects
+        """
+
+        # No screen_name or user_id implies default to authenticated user
+        if screen_name:
+            kwargs['screen_name'] = screen_name
+        elif user_id:
+            kwargs['user_id'] = user_id
+
+        kwargs['tweet_mode'] = 'extended'
+        count = 200
+        progress = FetchProgress() if progress is None else progress
+        tweets = progress.items
+        with progress:
+            while True:
+                # Limit each GET to a maximum 200 tweets
+                kwargs['count'] = min(count, max_tweets - len(tweets)) if max_tweets else count
+
+                # To correctly traverse the user's timeline, set the
+                # max_id parameter after the first tweets are available.
+                # See https://dev.twitter.com/rest/public/timelines.
+                if 'max_id' in progress.state:
+                    kwargs['max_id'] = progress.state['max_id']
+
+                results = self.endpoint_request(endpoint, **kwargs)
+                if not results:
+                    break
+                tweets.extend(results)
+                progress.state['max_id'] = min(tweet['id'] for tweet in results) - 1
+                self.observe_tweets(results)
+                if max_tweets and len(tweets) >= max_tweets:
+                    break
+
+        return tweets
+
+    def get_cursored_items(self, endpoint, key, count=5000, max_items=None,
+                           progress=None, **kwargs):
+        """
+        Helper request function for cursored objects.
+        
+        :param endpoint: Endpoint request string, e.g. '/followers/ids'
+        :param key: Cursored items key, e.g. 'ids'
+        :param count: Maximum items per request
+        :param max_items: Maximum total items requested
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: A list of requested objects
+        """
+
+        kwargs['count'] = count
+        progress = FetchProgress() if progress is None else progress
+        items = progress.items
+        cursor = progress.state.get('cursor', -1)
+        with progress:
+            while cursor:
+                kwargs['cursor'] = cursor
+                results = self.endpoint_request(endpoint, **kwargs)
+                if not results:
+                    break
+                items.extend(results[key])
+                if max_items and len(items) >= max_items:
+                    break
+                cursor = progress.state['cursor'] = results['next_cursor']
+
+        return items
+
+    def get_items_by_lookup(self, endpoint, item_keyword, items, progress=None, **kwargs):
+        """
+        Get user-requested objects of type item_keyword, named in the items list.
+        
+        :param endpoint: Endpoint request string, e.g. '/users/lookup'
+        :param item_keyword: Endpoint request keyword
+               Note: Endpoint 'id' requests must call the twitter.Twitter()
+               API methods with kwargs['_id'] to produce correct results.
+        :param items: User-supplied list of requested items, e.g. screen names
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: A list of user-requested objects. Note: The Twitter API
+                 doesn't guarantee that objects are returned in the order
+                 requested. The caller is responsible for confirming the
+                 order and completeness of the returned list, if necessary.
+        """
+
+        # Items are requested up to 100 per call, sharing calls with
+        # concurrent lookups to the same endpoint; see LookupBatcher.
+        items = items or []
+        items_max = LookupBatcher.items_max
+        progress = FetchProgress() if progress is None else progress
+        offset = progress.state.get('offset', 0)
+        with progress:
+            while offset < len(items):
+                batch_items = items[offset:offset + items_max]
+                progress.items.extend(self.lookup_batcher.lookup(endpoint, item_keyword,
+                                                                 batch_items, kwargs))
+                offset = progress.state['offset'] = offset + items_max
+
+        return progress.items
+
+    def send_lookup(self, endpoint, item_keyword, items, **kwargs):
+        """
+        Send one lookup request, for up to 100 items.
+
+        :param endpoint: Endpoint request string, e.g. '/users/lookup'
+        :param item_keyword: Endpoint request keyword
+        :param items: List of requested items
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: List of requested objects
+        """
+
+        kwargs[item_keyword] = ','.join(str(item) for item in items)
+        return self.endpoint_request(endpoint, **kwargs) or []
+
+    def get_rate_limits(self, key_0=None, key_1=None):
+        """
+        Query the authorized user's current rate limit data.
+
+        See Rate Limits chart at https://dev.twitter.com/rest/public/rate-limits
+
+        :param key_0: Optional, single category request, e.g. 'statuses'
+        :param key_1: Optional, subcategory category request, e.g. '/statuses/user_timeline'
+        :return: Requested limits dictionary
+        """
+
+        limits = self.endpoint_request('/application/rate_limit_status')
+        if limits:
+            limits = limits['resources']
+            if key_0 in limits:
+                limits = limits[key_0]
+                return limits[key_1] if key_1 else limits
+            else:
+                return limits
+
+        return None
+
+    def get_home_timeline(self, max_tweets=None, progress=None):
+        """
+        Get a list of the most recent tweets and retweets posted
+        by the authenticating user and the user's friends (following).        
+        
+        :param max_tweets: Optional maximum tweets requested
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :return: List of tweets
+        """
+
+        return self.get_user_tweets('/statuses/home_timeline', max_tweets=max_tweets,
+                                    progress=progress)
+
+    def get_user_timeline(self, screen_name=None, user_id=None, max_tweets=None,
+                          progress=None):
+        """
+        Get a list of the most recent tweets posted by the user specified
+        by screen_name or user_id. If both screen_name and user_id are given,
+        screen_name is used. If neither screen_name nor user_id is given,
+        results are collected for the authenticated user.        
+        
+        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
+        :param user_id: User's numeric ID
+        :param max_tweets: Maximum desired tweets
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :return: List of tweets
+        """
+
+        return self.get_user_tweets('/statuses/user_timeline', screen_name, user_id, max_tweets,
+                                    progress)
+
+    def get_user_favorites(self, screen_name=None, user_id=None, max_tweets=None,
+                           progress=None):
+        """
+        Get a list of the most recent tweets favorited by the authenticating
+        user, or the user specified by screen_name or user_id. If both screen_name
+        and user_id are given, screen_name is used. If neither screen_name nor user_id
+        is given, results are collected for the authenticated user.
+        
+        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
+        :param user_id: User's numeric ID
+        :param max_tweets: Maximum desired tweets
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :return: List of tweets
+        """
+
+        return self.get_user_tweets('/favorites/list', screen_name, user_id, max_tweets,
+                                    progress)
+
+    def get_user_profiles(self, screen_names=None, user_ids=None, progress=None):
+        """
+        Get a list of user objects as specified by values given by the screen_names
+        or user_ids list parameter. If both lists, screen_names and user_ids,
+        are given, screen_names is used.
+        
+        :param screen_names: List of user screen names, a.k.a. handles
+        :param user_ids: List of user numeric IDs
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :return: List of user objects
+        """
+
+        items = screen_names or user_ids
+        item_keyword = 'screen_name' if screen_names else 'user_id'
+        return self.get_items_by_lookup('/users/lookup', item_keyword, items, progress)
+
+    def get_tweets_by_id(self, ids, progress=None, **kwargs):
+        """
+        Get a list of tweets, specified by a given list of
+        numeric Tweet IDs in parameter ids.
+        
+        :param ids: List of unique numeric tweet IDs
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :return: List of requested tweets
+        """
+
+        kwargs['tweet_mode'] = 'extended'
+        tweets = self.get_items_by_lookup('/statuses/lookup', '_id', ids, progress, **kwargs)
+        self.observe_tweets(tweets)
+        return tweets
+
+    def get_connection_ids(self, which='friends', screen_name=None, user_id=None,
+                           max_ids=None, progress=None, **kwargs):
+        """
+        For the user specified by screen_name or user_id, get a list of user IDs
+        for every user the specified user is following (which="friends"), or
+        for every user following the specified user (which=followers"). If both
+        screen_name and user_id are given, screen_name is used.  
+        :param which: Connection type, Friends or Followers
+        :param screen_name: User's screen name, a.k.a. handle, e.g. 'katyperry'
+        :param user_id: User's numeric ID
+        :param max_ids: Maximum IDs to request
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: List of user IDs
+        """
+
+        endpoint = {'friends': '/friends/ids',
+                    'followers': '/followers/ids'}.get(which)
+        # No screen_name or user_id implies default to authenticated user
+        if screen_name:
+            kwargs['screen_name'] = screen_name
         elif user_id:
             kwargs['user_id'] = user_id
-        return self.get_cursored_items(endpoint, 'ids', max_items=max_ids, **kwargs)
+        return self.get_cursored_items(endpoint, 'ids', max_items=max_ids,
+                                       progress=progress, **kwargs)
 
     def get_trend_locations(self, lat_lon=None):
         """
@@ -641,20 +2051,118 @@ class TwitterTools:
         kwargs = {'_id': woeid}
         return self.endpoint_request('/trends/place', **kwargs)[0]['trends']
 
-    def post_status_update(self, status, media_ids=None, **kwargs):
+    def upload_media(self, path, media_category=None, chunk_size=4 * 1024 * 1024,
+                     workers=4):
+        """
+        Upload a media file (image, GIF or video) with the chunked
+        INIT/APPEND/FINALIZE upload, then wait for Twitter to finish
+        processing it, if necessary. The file is memory-mapped and
+        segments are read and uploaded concurrently, so memory use
+        is limited to about workers * chunk_size bytes.
+
+        See https://developer.twitter.com/en/docs/media/upload-media/uploading-media/chunked-media-upload
+
+        :param path: Media file path
+        :param media_category: 'tweet_image', 'tweet_gif' or 'tweet_video';
+                               default by file type
+        :param chunk_size: Segment size in bytes; at most 5 MB
+        :param workers: Concurrent segment uploads
+        :return: Media id string, for post_status_update()
+        """
+
+        import mimetypes
+        import mmap
+
+        media_type = mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+        if not media_category:
+            if media_type.startswith('video/'):
+                media_category = 'tweet_video'
+            elif media_type == 'image/gif':
+                media_category = 'tweet_gif'
+            else:
+                media_category = 'tweet_image'
+
+        with open(path, mode='rb') as f:
+            total_bytes = os.fstat(f.fileno()).st_size
+            if not total_bytes:
+                raise MediaUploadError(f'Empty media file: {path}')
+
+            response = self.endpoint_request('/media/upload', _method='POST', command='INIT',
+                                             total_bytes=total_bytes, media_type=media_type,
+                                             media_category=media_category)
+            media_id = response['media_id_string']
+
+            def append(segment_index):
+                """
+                Upload one segment, reading it from the memory-mapped file.
+
+                :param segment_index: Zero-based segment number
+                :return: None
+                """
+
+                start = segment_index * chunk_size
+                self.endpoint_request('/media/upload', _method='POST', command='APPEND',
+                                      media_id=media_id, segment_index=segment_index,
+                                      media=media[start:start + chunk_size])
+
+            # def append
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as media:
+                segments = range(math.ceil(total_bytes / chunk_size))
+                with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                    # Raise the first segment error, if any
+                    list(executor.map(append, segments))
+
+        response = self.endpoint_request('/media/upload', _method='POST',
+                                         command='FINALIZE', media_id=media_id)
+
+        # Videos and GIFs are processed after upload; poll until done
+        info = response.get('processing_info')
+        while info and info.get('state') in ('pending', 'in_progress'):
+            time.sleep(info.get('check_after_secs', 1))
+            response = self.endpoint_request('/media/upload', _method='GET',
+                                             command='STATUS', media_id=media_id)
+            info = response.get('processing_info')
+
+        if info and info.get('state') == 'failed':
+            raise MediaUploadError(f'Processing failed for {path}: {info.get("error")}')
+
+        return media_id
+
+    def upload_media_async(self, path, **kwargs):
+        """
+        Upload a media file in the background; see upload_media().
+
+        :param path: Media file path
+        :param kwargs: Optional upload_media() keyword arguments
+        :return: concurrent.futures.Future for the media id string
+        """
+
+        if self.media_executor is None:
+            self.media_executor = concurrent.futures.ThreadPoolExecutor(4)
+        return self.media_executor.submit(self.upload_media, path, **kwargs)
+
+    def post_status_update(self, status, media_ids=None, media=None, **kwargs):
         """
         Post a Tweet!
         
         :param status: Required text
         :param media_ids: Optional media id list. Twitter-supplied ids from media upload.
                           See https://dev.twitter.com/rest/reference/post/media/upload
+        :param media: Optional list of media file paths to upload concurrently
+                      and attach, after any media_ids; see upload_media()
         :param kwargs: Optional, user-supplied keyword arguments
         :return: Status (tweet) object, or error on failure
         """
 
+        media_ids = list(media_ids or [])
+        if media:
+            uploads = [self.upload_media_async(path) for path in media]
+            media_ids.extend(upload.result() for upload in uploads)
+
         kwargs['status'] = status
         if media_ids:
-            kwargs['media_ids'] = media_ids
+            kwargs['media_ids'] = ','.join(str(media_id) for media_id in media_ids)
         return self.endpoint_request('/statuses/update', **kwargs)
 
     def post_lists_create(self, name, mode='private', description=None, **kwargs):
@@ -670,11 +2178,82 @@ class TwitterTools:
         :return: Twitter List object
         """
 
-        kwargs['name'] = name
-        kwargs['mode'] = mode
-        if description:
-            kwargs['description'] = description
-        return self.endpoint_request('/lists/create', **kwargs)
+        kwargs['name'] = name
+        kwargs['mode'] = mode
+        if description:
+            kwargs['description'] = description
+        return self.endpoint_request('/lists/create', **kwargs)
+
+    @staticmethod
+    def get_list_kwargs(list_id=None, slug=None, owner_screen_name=None,
+                        owner_id=None, **kwargs):
+        """
+        Build list-identifying keyword arguments, omitting those not given.
+
+        :param list_id: Numerical list id
+        :param slug: List slug; requires owner_screen_name or owner_id
+        :param owner_screen_name: User screen name who owns list requested by slug.
+        :param owner_id: User ID who owns list requested by slug.
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: Keyword arguments dictionary
+        """
+
+        params = {'list_id': list_id, 'slug': slug,
+                  'owner_screen_name': owner_screen_name, 'owner_id': owner_id}
+        kwargs.update((key, value) for key, value in params.items() if value is not None)
+        return kwargs
+
+    def get_list_members(self, list_id=None, slug=None,
+                         owner_screen_name=None, owner_id=None,
+                         max_members=None, progress=None, **kwargs):
+        """
+        Get the members of a list.
+
+        :param list_id: Numerical list id
+        :param slug: You can identify a list by its slug instead
+                     of by its numerical id. If using slug, must
+                     also specify list owner using owner_id or
+                     owner_screen_name parameter.
+        :param owner_screen_name: User screen name who owns list requested by slug.
+        :param owner_id: User ID who owns list requested by slug.
+        :param max_members: Maximum members requested
+        :param progress: Optional FetchProgress of an interrupted call to resume
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: List of user objects
+        """
+
+        kwargs = self.get_list_kwargs(list_id, slug, owner_screen_name, owner_id, **kwargs)
+        kwargs.setdefault('skip_status', True)
+        kwargs.setdefault('include_entities', False)
+        return self.get_cursored_items('/lists/members', 'users', max_items=max_members,
+                                       progress=progress, **kwargs)
+
+    def post_lists_members_batch(self, endpoint, user_ids=None, screen_names=None, **kwargs):
+        """
+        Add or remove list members in batches of up to 100 users per request.
+
+        :param endpoint: '/lists/members/create_all' or '/lists/members/destroy_all'
+        :param user_ids: Python list of user IDs
+        :param screen_names: Python list of screen names
+        :param kwargs: List-identifying and optional keyword arguments
+        :return: Twitter List object from the last request,
+                 or None if no users were given
+        :raises ListMembersError: If a batch request fails; later
+                                  batches aren't sent
+        """
+
+        # Request up to 100 users per call
+        items_max = 100
+        items = screen_names or user_ids or []
+        item_keyword = 'screen_name' if screen_names else 'user_id'
+        response = None
+        for i in range(0, len(items), items_max):
+            kwargs[item_keyword] = ','.join(str(item) for item in items[i:i + items_max])
+            response = self.endpoint_request(endpoint, **kwargs)
+            if response is None:
+                raise ListMembersError(endpoint, list(items[:i]), list(items[i:]))
+
+        return response
 
     def post_lists_members_create(self, mode='add',
                                   list_id=None, slug=None,
@@ -686,39 +2265,119 @@ class TwitterTools:
         """
         Add user(s) to a list
 
-        :param mode: 'add' member to list, or create 'all' members
+        :param mode: 'add' member to list, or create 'all' members.
+                     Either mode adds every given user; several users
+                     are added in batches of up to 100 per request.
         :param list_id: Numerical list id
         :param slug: You can identify a list by its slug instead
                      of by its numerical id. If using slug, must
                      also specify list owner using owner_id or
                      owner_screen_name parameter.
-        :param user_ids: Python list of user IDs; up to 100 per request.
-        :param screen_names: Python list of screen names; up to 100 per request.
+        :param user_ids: Python list of user IDs
+        :param screen_names: Python list of screen names
         :param owner_screen_name: User screen name who owns list requested by slug.
         :param owner_id: User ID who owns list requested by slug.
         :param kwargs: Optional, user-supplied keyword arguments
         :return: Twitter List object
         """
 
-        kwargs['slug'] = slug
-        kwargs['list_id'] = list_id
-        kwargs['owner_screen_name'] = owner_screen_name
-        kwargs['owner_id'] = owner_id
+        kwargs = self.get_list_kwargs(list_id, slug, owner_screen_name, owner_id, **kwargs)
 
-        names = screen_names
-        if names:
-            kwargs['screen_name'] = names[0] if mode == 'add' else ','.join(names)
-        elif user_ids:
-            kwargs['user_id'] = user_ids[0] if mode == 'add' else ','.join(user_ids)
-        else:
+        items = screen_names or user_ids
+        if not items:
             return None
 
-        if mode == 'add':
+        if mode == 'add' and len(items) == 1:
+            item_keyword = 'screen_name' if screen_names else 'user_id'
+            kwargs[item_keyword] = items[0]
             return self.endpoint_request('/lists/members/create', **kwargs)
+
+        return self.post_lists_members_batch('/lists/members/create_all',
+                                             user_ids, screen_names, **kwargs)
+
+    def post_lists_members_destroy(self, list_id=None, slug=None,
+                                   user_ids=None, screen_names=None,
+                                   owner_screen_name=None,
+                                   owner_id=None,
+                                   **kwargs):
+        """
+        Remove user(s) from a list, in batches of up to 100 per request.
+
+        :param list_id: Numerical list id
+        :param slug: List slug; requires owner_screen_name or owner_id
+        :param user_ids: Python list of user IDs
+        :param screen_names: Python list of screen names
+        :param owner_screen_name: User screen name who owns list requested by slug.
+        :param owner_id: User ID who owns list requested by slug.
+        :param kwargs: Optional, user-supplied keyword arguments
+        :return: Twitter List object
+        """
+
+        kwargs = self.get_list_kwargs(list_id, slug, owner_screen_name, owner_id, **kwargs)
+        return self.post_lists_members_batch('/lists/members/destroy_all',
+                                             user_ids, screen_names, **kwargs)
+
+    def sync_list_members(self, list_id=None, slug=None,
+                          user_ids=None, screen_names=None,
+                          owner_screen_name=None,
+                          owner_id=None):
+        """
+        Make a list's membership match the given users. Fetches the
+        current members, then removes members not given and adds given
+        users who aren't members, using the fewest batched requests.
+        Removals are made first, so a list near its member limit
+        has room for additions. To remove every member, pass an empty
+        user_ids list; omitting both lists is an error.
+
+        :param list_id: Numerical list id
+        :param slug: List slug; requires owner_screen_name or owner_id
+        :param user_ids: Python list of target member user IDs
+        :param screen_names: Python list of target member screen names
+        :param owner_screen_name: User screen name who owns list requested by slug.
+        :param owner_id: User ID who owns list requested by slug.
+        :return: Dictionary with 'added' and 'removed' lists of user IDs
+                 or screen names, matching the target list type
+        :raises ListMembersError: If a batch request fails; its result
+                                  attribute holds the changes made
+        """
+
+        if screen_names is None and user_ids is None:
+            raise ValueError('Give the target members as user_ids or screen_names')
+
+        list_kwargs = self.get_list_kwargs(list_id, slug, owner_screen_name, owner_id)
+        members = self.get_list_members(**list_kwargs)
+
+        if screen_names is not None:
+            # Screen names are case-insensitive
+            current = {member['screen_name'].lower(): member['screen_name'] for member in members}
+            target = {name.lower(): name for name in screen_names}
+            item_keyword = 'screen_names'
         else:
-            return self.endpoint_request('/lists/members/create_all', **kwargs)
+            current = {member['id_str']: member['id_str'] for member in members}
+            target = {str(user_id): str(user_id) for user_id in user_ids}
+            item_keyword = 'user_ids'
+
+        removed = [current[key] for key in current if key not in target]
+        added = [target[key] for key in target if key not in current]
 
-    def search_tweets(self, query, max_requests=5):
+        result = {'added': [], 'removed': []}
+        try:
+            if removed:
+                self.post_lists_members_batch('/lists/members/destroy_all',
+                                              **{item_keyword: removed}, **list_kwargs)
+                result['removed'] = removed
+            if added:
+                self.post_lists_members_batch('/lists/members/create_all',
+                                              **{item_keyword: added}, **list_kwargs)
+                result['added'] = added
+        except ListMembersError as e:
+            result['removed' if e.endpoint.endswith('destroy_all') else 'added'] = e.done
+            e.result = result
+            raise
+
+        return result
+
+    def search_tweets(self, query, max_requests=5, progress=None):
         """
         Get a list of relevant Tweets matching a specified query.
         
@@ -746,26 +2405,935 @@ class TwitterTools:
                              returns up to 100 results, and the
                              authenticated user is limited to
                              180 requests per 15 minutes.                             
+        :param progress: Optional FetchProgress of an interrupted call to resume
         :return: List of tweets
         """
 
+        progress = FetchProgress() if progress is None else progress
+        tweets = progress.items
         # Prepare first request
-        kwargs = {'q': query, 'count': 100, 'tweet_mode': 'extended'}
-        tweets = []
-        for search in range(max_requests):
-            if tweets:
+        state = progress.state
+        state.setdefault('kwargs', {'q': query, 'count': 100, 'tweet_mode': 'extended'})
+        state.setdefault('requests', 0)
+        with progress:
+            while state['requests'] < max_requests:
+                results = self.endpoint_request('/search/tweets', **state['kwargs'])
+                state['requests'] += 1
+                if not results['statuses']:
+                    break
+                tweets.extend(results['statuses'])
+                self.observe_tweets(results['statuses'])
+
                 try:
                     next_results = results['search_metadata']['next_results']
-                    # Create a dict from next_results, which has this format:
-                    # ?max_id=313519052523986943&q=NCAA&include_entities=1
-                    kwargs = dict(item.split('=') for item in next_results[1:].split("&"))
                 # No further results when 'next_results' is missing
                 except KeyError:
                     break
+                # Create a dict from next_results, which has this format:
+                # ?max_id=313519052523986943&q=NCAA&include_entities=1
+                state['kwargs'] = dict(item.split('=') for item in next_results[1:].split("&"))
+
+        return tweets
+
+
+class CrawlQueue:
+    """
+    Shared crawl work queue, stored in SQLite, for spreading a crawl
+    across processes, machines and credentials.
+
+    Work units (e.g. a user timeline, one page of follower IDs, a batch
+    of up to 100 lookups, or a search query) are leased to one worker
+    at a time. A lease expires if the worker doesn't complete the unit
+    in time, making the unit available again. Failed units are retried
+    with growing delays up to max_attempts. Each unit's completion is
+    recorded exactly once: only the current lease holder can complete
+    a unit, so a worker whose lease expired can't complete it again.
+
+    Workers on other machines can share a queue through
+    CrawlQueueServer and RemoteCrawlQueue. Any object with the same
+    put_many(), lease(), renew(), complete(), fail(), release() and
+    stats() methods can serve as a queue backend for CrawlWorker.
+    """
+
+    def __init__(self, path, max_attempts=5):
+        """
+        :param path: SQLite database file path; created if necessary
+        :param max_attempts: Failed attempts before a unit is abandoned
+        """
+
+        import sqlite3
+
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit mode; transactions are begun explicitly
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA busy_timeout=30000')
+        self.db.execute('CREATE TABLE IF NOT EXISTS units ('
+                        'id INTEGER PRIMARY KEY, key TEXT UNIQUE, kind TEXT, payload TEXT, '
+                        "state TEXT DEFAULT 'pending', not_before REAL DEFAULT 0, "
+                        'owner TEXT, token TEXT, lease_expires REAL, '
+                        'attempts INTEGER DEFAULT 0, error TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS units_ready ON units (state, not_before)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS completions ('
+                        'unit_id INTEGER PRIMARY KEY, owner TEXT, completed REAL, result TEXT)')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def transaction(self, sql, *params, many=False):
+        """
+        Run one statement, or a list of (sql, params) statements, in a
+        write transaction.
+
+        :param sql: SQL statement, or list of (sql, params) tuples
+        :param params: Statement parameters
+        :param many: Run sql with each of params[0]'s parameter tuples
+        :return: Total rows changed
+        """
+
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                if many:
+                    changed = self.db.executemany(sql, params[0]).rowcount
+                else:
+                    statements = sql if isinstance(sql, list) else [(sql, params)]
+                    changed = sum(self.db.execute(*statement).rowcount for statement in statements)
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+            return changed
+
+    def put_many(self, kind, payloads):
+        """
+        Add work units. A unit with the same kind and payload as an
+        existing unit is skipped, so re-adding work is harmless.
+
+        :param kind: Unit kind, e.g. 'timeline'; see CrawlWorker
+        :param payloads: Iterable of JSON-serializable payload dictionaries
+        :return: Number of units added
+        """
+
+        rows = []
+        for payload in payloads:
+            payload = json.dumps(payload, sort_keys=True)
+            rows.append((f'{kind}:{payload}', kind, payload))
+        return self.transaction('INSERT OR IGNORE INTO units (key, kind, payload) VALUES (?, ?, ?)',
+                                rows, many=True)
+
+    def put(self, kind, **payload):
+        """
+        Add one work unit; see put_many().
+
+        :param kind: Unit kind, e.g. 'timeline'; see CrawlWorker
+        :param payload: Payload keyword arguments
+        :return: Number of units added, 0 or 1
+        """
+
+        return self.put_many(kind, [payload])
+
+    def put_lookups(self, kind, keyword, items):
+        """
+        Add lookup work units in batches of up to 100 items.
+
+        :param kind: 'lookup' for users or 'tweets' for tweets by id
+        :param keyword: Payload item list keyword, e.g. 'user_ids',
+                        'screen_names' or 'ids'
+        :param items: List of items to look up
+        :return: Number of units added
+        """
+
+        items_max = 100
+        return self.put_many(kind, ({keyword: items[i:i + items_max]}
+                                    for i in range(0, len(items), items_max)))
+
+    def lease(self, owner, seconds=600, kinds=None):
+        """
+        Lease the next ready unit: a pending unit that's due, or a leased
+        unit whose lease has expired. An expired lease counts as a failed
+        attempt, so a unit that keeps stalling its workers is abandoned
+        after max_attempts.
+
+        :param owner: Worker name
+        :param seconds: Lease duration
+        :param kinds: Optional list of unit kinds to lease
+        :return: Unit dictionary with 'id', 'kind', 'payload', 'token' and
+                 'attempts' keys, or None if no unit is ready
+        """
+
+        now = time.time()
+        sql = ("SELECT id, kind, payload, attempts, state FROM units "
+               "WHERE ((state = 'pending' AND not_before <= ?) "
+               "OR (state = 'leased' AND lease_expires <= ?))")
+        params = [now, now]
+        if kinds:
+            sql += f' AND kind IN ({", ".join("?" * len(kinds))})'
+            params.extend(kinds)
+        sql += ' ORDER BY not_before, id LIMIT 1'
+
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                while True:
+                    row = self.db.execute(sql, params).fetchone()
+                    if not row:
+                        break
+                    unit_id, kind, payload, attempts, state = row
+                    if state == 'leased':
+                        attempts += 1
+                        if attempts >= self.max_attempts:
+                            self.db.execute("UPDATE units SET state = 'failed', attempts = ?, "
+                                            "error = 'Lease expired', token = NULL WHERE id = ?",
+                                            (attempts, unit_id))
+                            continue
+                    token = os.urandom(8).hex()
+                    self.db.execute("UPDATE units SET state = 'leased', owner = ?, token = ?, "
+                                    "lease_expires = ?, attempts = ? WHERE id = ?",
+                                    (owner, token, now + seconds, attempts, unit_id))
+                    break
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+        if not row:
+            return None
+        return {'id': unit_id, 'kind': kind, 'payload': json.loads(payload),
+                'token': token, 'attempts': attempts}
+
+    def renew(self, unit, seconds=600):
+        """
+        Extend a unit's lease.
+
+        :param unit: Leased unit dictionary
+        :param seconds: New lease duration, from now
+        :return: True if the lease is still held
+        """
+
+        return bool(self.transaction("UPDATE units SET lease_expires = ? "
+                                     "WHERE id = ? AND token = ? AND state = 'leased'",
+                                     time.time() + seconds, unit['id'], unit['token']))
+
+    def complete(self, unit, result=None):
+        """
+        Record a unit's completion, exactly once.
+
+        :param unit: Leased unit dictionary
+        :param result: Optional JSON-serializable result summary
+        :return: True if recorded; False if the lease was lost
+        """
+
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                changed = self.db.execute("UPDATE units SET state = 'done', error = NULL "
+                                          "WHERE id = ? AND token = ? AND state = 'leased'",
+                                          (unit['id'], unit['token'])).rowcount
+                if changed:
+                    self.db.execute('INSERT INTO completions '
+                                    'SELECT id, owner, ?, ? FROM units WHERE id = ?',
+                                    (time.time(), json.dumps(result), unit['id']))
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+        return bool(changed)
+
+    def fail(self, unit, error):
+        """
+        Record a failed attempt. The unit is retried after a delay that
+        doubles with each attempt, or abandoned after max_attempts.
+
+        :param unit: Leased unit dictionary
+        :param error: Error description
+        :return: True if the lease was held
+        """
+
+        attempts = unit['attempts'] + 1
+        state = 'failed' if attempts >= self.max_attempts else 'pending'
+        not_before = time.time() + 60 * 2 ** attempts
+        return bool(self.transaction("UPDATE units SET state = ?, attempts = ?, not_before = ?, "
+                                     "error = ?, token = NULL "
+                                     "WHERE id = ? AND token = ? AND state = 'leased'",
+                                     state, attempts, not_before, str(error),
+                                     unit['id'], unit['token']))
+
+    def release(self, unit, retry_at=0):
+        """
+        Return a leased unit to the queue without counting an attempt,
+        e.g. when its endpoint is rate limited.
+
+        :param unit: Leased unit dictionary
+        :param retry_at: Earliest retry time, in seconds since the epoch
+        :return: True if the lease was held
+        """
+
+        return bool(self.transaction("UPDATE units SET state = 'pending', not_before = ?, "
+                                     "token = NULL "
+                                     "WHERE id = ? AND token = ? AND state = 'leased'",
+                                     retry_at, unit['id'], unit['token']))
+
+    def stats(self):
+        """
+        :return: Dictionary of unit counts by state
+        """
+
+        with self.lock:
+            rows = self.db.execute('SELECT state, COUNT(*) FROM units GROUP BY state').fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.db.close()
+
+
+class RemoteCrawlQueue:
+    """
+    Client for a CrawlQueue shared over HTTP by CrawlQueueServer,
+    with the same methods as CrawlQueue.
+    """
+
+    methods = ('put_many', 'put', 'put_lookups', 'lease', 'renew',
+               'complete', 'fail', 'release', 'stats')
+
+    def __init__(self, url, token=None, timeout=60):
+        """
+        :param url: Server URL, e.g. 'http://crawlhost:8470'
+        :param token: Optional shared secret, as given to the server
+        :param timeout: Request timeout, in seconds
+        """
+
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.url!r})'
+
+    def __getattr__(self, name):
+        if name not in self.methods:
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a CrawlQueue method on the server.
+
+        :param method: CrawlQueue method name
+        :param args: Positional arguments
+        :param kwargs: Keyword arguments
+        :return: Method result
+        """
+
+        import urllib.request
+
+        data = json.dumps({'args': args, 'kwargs': kwargs}).encode('utf-8')
+        request = urllib.request.Request(f'{self.url}/{method}', data=data,
+                                         headers={'Content-Type': 'application/json',
+                                                  'X-Crawl-Token': self.token or ''})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)['result']
+
+
+class CrawlQueueServer:
+    """
+    Share a CrawlQueue with workers on other machines over HTTP, for
+    use with RemoteCrawlQueue. Requests are not encrypted; serve on a
+    trusted network, and set a shared token.
+
+    Example:
+    server = CrawlQueueServer(CrawlQueue('crawl.db'), ('0.0.0.0', 8470), token='secret')
+    server.serve_forever()
+    """
+
+    def __init__(self, queue, address=('127.0.0.1', 8470), token=None):
+        """
+        :param queue: CrawlQueue object
+        :param address: (host, port) tuple to listen on
+        :param token: Optional shared secret required from clients
+        """
+
+        import hmac
+        import http.server
+
+        crawl_queue = queue
+        expected_token = (token or '').encode('utf-8')
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                method = self.path.strip('/')
+                # Compare in constant time, so response times don't reveal the token
+                given_token = self.headers.get('X-Crawl-Token', '').encode('utf-8', 'replace')
+                if (not hmac.compare_digest(given_token, expected_token)
+                        or method not in RemoteCrawlQueue.methods):
+                    self.send_error(403)
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length))
+                    args, kwargs = list(request['args']), dict(request['kwargs'])
+                except (ValueError, KeyError, TypeError) as e:
+                    self.send_error(400, repr(e))
+                    return
+                try:
+                    result = getattr(crawl_queue, method)(*args, **kwargs)
+                except Exception as e:
+                    self.send_error(500, repr(e))
+                    return
+                body = json.dumps({'result': result}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.queue = queue
+        self.server = http.server.ThreadingHTTPServer(address, Handler)
+        self.address = self.server.server_address
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CrawlWorker:
+    """
+    Crawl worker: leases units from a CrawlQueue (or RemoteCrawlQueue),
+    runs them with TwitterTools methods, writes results to a sink, and
+    records completion. Run any number of workers, on any number of
+    machines and credentials, against one queue.
+
+    Unit kinds and payloads:
+    'timeline':    {'screen_name' or 'user_id', optional 'max_tweets'}
+    'favorites':   {'screen_name' or 'user_id', optional 'max_tweets'}
+    'connections': {'which': 'followers' or 'friends', 'screen_name' or
+                    'user_id', optional 'cursor'}; one page of IDs per
+                   unit, adding a unit for the next page
+    'lookup':      {'user_ids' or 'screen_names'}, up to 100 users
+    'tweets':      {'ids'}, up to 100 tweet IDs
+    'search':      {'query', optional 'max_requests'}
+
+    While a unit runs, including any rate limit waits, a background
+    thread renews its lease every third of lease_seconds. Results are
+    written to the sink only if the lease is still held, and before the
+    unit is completed, so if a worker stops in between, the unit's
+    results are written again by the worker that takes it over.
+
+    Example:
+    queue = CrawlQueue('crawl.db')
+    queue.put_many('timeline', ({'screen_name': name} for name in screen_names))
+    worker = CrawlWorker(TwitterTools(credentials, blocking=False),
+                         queue, JsonLinesSink('tweets.jsonl'))
+    worker.run()
+    """
+
+    def __init__(self, twt, queue, sink, name=None, lease_seconds=900):
+        """
+        :param twt: TwitterTools object; a non-blocking object lets the
+                    worker move on to other units while an endpoint is
+                    rate limited
+        :param queue: CrawlQueue or RemoteCrawlQueue object
+        :param sink: Object with a write(items) method, e.g. JsonLinesSink
+        :param name: Worker name; default host name and process ID
+        :param lease_seconds: Unit lease duration
+        """
+
+        import socket
+
+        self.twt = twt
+        self.queue = queue
+        self.sink = sink
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self.sink_lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r})'
+
+    def run_unit(self, unit):
+        """
+        Run one work unit.
+
+        :param unit: Leased unit dictionary
+        :return: List of result objects
+        """
+
+        kind = unit['kind']
+        payload = dict(unit['payload'])
+        twt = self.twt
+
+        if kind in ('timeline', 'favorites'):
+            endpoint = {'timeline': '/statuses/user_timeline',
+                        'favorites': '/favorites/list'}[kind]
+            return twt.get_user_tweets(endpoint, **payload) or []
+
+        if kind == 'connections':
+            which = payload.pop('which')
+            cursor = payload.pop('cursor', -1)
+            endpoint = {'friends': '/friends/ids', 'followers': '/followers/ids'}[which]
+            results = twt.endpoint_request(endpoint, cursor=cursor, count=5000, **payload)
+            if not results:
+                return []
+            if results['next_cursor']:
+                self.queue.put('connections', which=which,
+                               cursor=results['next_cursor'], **payload)
+            user = payload.get('screen_name') or payload.get('user_id')
+            return [{'user': user, 'which': which, 'id': user_id} for user_id in results['ids']]
+
+        if kind == 'lookup':
+            return twt.get_user_profiles(**payload)
+
+        if kind == 'tweets':
+            return twt.get_tweets_by_id(**payload)
+
+        if kind == 'search':
+            return twt.search_tweets(**payload)
+
+        raise ValueError(f'Unknown work unit kind: {kind!r}')
+
+    def renew_lease(self, unit, stop):
+        """
+        Renew a unit's lease every third of lease_seconds until stop is
+        set or the lease is lost.
+
+        :param unit: Leased unit dictionary
+        :param stop: threading.Event, set when the unit has run
+        :return: None
+        """
+
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.renew(unit, self.lease_seconds):
+                    return
+            except OSError:
+                # Try again at the next renewal, e.g. if a remote queue is unreachable
+                continue
+
+    def run(self, max_units=None, idle_wait=None):
+        """
+        Lease and run units until the queue has no ready units.
+
+        :param max_units: Optional maximum units to run
+        :param idle_wait: If given, when no unit is ready, wait this many
+                          seconds and check again, rather than return
+        :return: Number of units completed
+        """
+
+        completed = 0
+        while max_units is None or completed < max_units:
+            unit = self.queue.lease(self.name, self.lease_seconds)
+            if unit is None:
+                if idle_wait is None:
+                    break
+                time.sleep(idle_wait)
+                continue
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self.renew_lease, args=(unit, stop), daemon=True)
+            heartbeat.start()
+            try:
+                results = self.run_unit(unit)
+            except RetryLater as e:
+                self.queue.release(unit, e.retry_at)
+                continue
+            except Exception as e:
+                now = f'{datetime.datetime.now():%Y-%m-%d %H:%M:%S}'
+                print(f'{now}: Error on {unit["kind"]} unit {unit["id"]}: {e!r}',
+                      file=sys.stderr, flush=True)
+                self.queue.fail(unit, repr(e))
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            # Another worker has taken over the unit if the lease was lost
+            if not self.queue.renew(unit, self.lease_seconds):
+                continue
+            with self.sink_lock:
+                self.sink.write(results)
+            if self.queue.complete(unit, {'results': len(results)}):
+                completed += 1
+
+        return completed
+
+
+# --- Define command-line interface --- #
+
+
+def read_items(path_or_buf):
+    """
+    Read input items, one per line, e.g. screen names or search queries.
+    Blank lines and lines starting with '#' are skipped.
+
+    :param path_or_buf: String, file path, '-' for stdin, or file handle
+    :return: List of item strings
+    """
+
+    if path_or_buf == '-':
+        lines = sys.stdin.read().splitlines()
+    elif hasattr(path_or_buf, 'read'):
+        lines = path_or_buf.read().splitlines()
+    else:
+        with open(path_or_buf, encoding='utf-8-sig') as f:
+            lines = f.read().splitlines()
+
+    items = (line.strip() for line in lines)
+    return [item for item in items if item and not item.startswith('#')]
+
+
+def open_output(path, append=False, encoding='utf-8'):
+    """
+    Open an output text file, or stdout for path '-'.
+
+    :param path: Output file path, or '-' for stdout
+    :param append: Append to an existing file; default False
+    :param encoding: Output file encoding
+    :return: File handle
+    """
+
+    if path == '-':
+        return sys.stdout
+    return open(path, mode='a' if append else 'w', encoding=encoding, newline='')
+
+
+def is_empty_output(path):
+    """
+    :param path: Output file path, or '-' for stdout
+    :return: True if the output has no content yet
+    """
+
+    return path == '-' or not os.path.exists(path) or os.path.getsize(path) == 0
+
+
+def unpack_connection(connection):
+    """
+    Extract select fields from a follower or friend connection,
+    as produced by the command-line followers and friends commands.
+
+    :param connection: Connection dictionary
+    :return: Ordered dictionary of select connection field values
+    """
+
+    fields = [('user', connection['user']),
+              ('which', connection['which']),
+              ('id', connection['id'])
+              ]
+    return collections.OrderedDict(fields)
+
+
+def unpack_trend(trend):
+    """
+    Extract select fields from a trend object, as produced by
+    the command-line trends command.
+
+    :param trend: Twitter Trend object, with added 'woeid' field
+    :return: Ordered dictionary of select trend field values
+    """
+
+    fields = [('woeid', get_data(trend, 'woeid')),
+              ('name', get_data(trend, 'name')),
+              ('query', get_data(trend, 'query')),
+              ('tweet_volume', get_data(trend, 'tweet_volume')),
+              ('url', get_data(trend, 'url'))
+              ]
+    return collections.OrderedDict(fields)
+
+
+class JsonLinesSink:
+    """
+    Stream raw Twitter objects to a JSON Lines file, one object per line.
+    """
+
+    def __init__(self, path, unpack_func=None, append=False):
+        self.file = open_output(path, append)
+
+    def write(self, items):
+        for item in items:
+            self.file.write(json.dumps(item) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class CsvSink:
+    """
+    Stream Twitter objects to a CSV file, saving select fields as
+    defined by the given unpack function, e.g. unpack_tweet().
+    """
+
+    def __init__(self, path, unpack_func, append=False):
+        self.unpack_func = unpack_func
+        self.write_header = not append or is_empty_output(path)
+        encoding = 'utf-8-sig' if self.write_header and path != '-' else 'utf-8'
+        self.file = open_output(path, append, encoding)
+        self.writer = None
+
+    def write(self, items):
+        for item in items:
+            row = self.unpack_func(item)
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(row), lineterminator='\n')
+                if self.write_header:
+                    self.writer.writeheader()
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetSink:
+    """
+    Collect Twitter objects and save them to a columnar Parquet file
+    when closed, saving select fields as defined by the given unpack
+    function. Requires pandas, and pyarrow or fastparquet.
+    """
+
+    def __init__(self, path, unpack_func, append=False):
+        if path == '-':
+            raise ValueError('Parquet output requires a file path')
+        self.path = path
+        self.unpack_func = unpack_func
+        self.append = append
+        self.rows = []
+
+    def write(self, items):
+        self.rows.extend(self.unpack_func(item) for item in items)
+
+    def close(self):
+        import pandas
+
+        df = pandas.DataFrame(self.rows)
+        if self.append and not is_empty_output(self.path):
+            df = pandas.concat([pandas.read_parquet(self.path), df], ignore_index=True)
+        df.to_parquet(self.path, index=False)
 
-            results = self.endpoint_request('/search/tweets', **kwargs)
-            if not results['statuses']:
+
+def fetch_command_item(twt, args, items):
+    """
+    Run one command-line request for a unit of input items.
+
+    :param twt: TwitterTools object
+    :param args: Parsed command-line arguments
+    :param items: List of input items; a single item except for lookup
+    :return: List of Twitter objects
+    """
+
+    command = args.command
+    item = items[0]
+    user = {'user_id' if args.ids else 'screen_name': item}
+
+    if command in ('timeline', 'favorites'):
+        endpoint = {'timeline': '/statuses/user_timeline',
+                    'favorites': '/favorites/list'}[command]
+        return twt.get_user_tweets(endpoint, max_tweets=args.max_tweets, **user) or []
+
+    if command == 'lookup':
+        if args.tweets:
+            return twt.get_tweets_by_id(items)
+        if args.ids:
+            return twt.get_user_profiles(user_ids=items)
+        return twt.get_user_profiles(screen_names=items)
+
+    if command in ('followers', 'friends'):
+        ids = twt.get_connection_ids(command, max_ids=args.max_ids, **user) or []
+        return [{'user': item, 'which': command, 'id': user_id} for user_id in ids]
+
+    if command == 'search':
+        return twt.search_tweets(item, max_requests=args.max_requests)
+
+    if command == 'trends':
+        trends = twt.get_trends(woeid=item)
+        return [dict(trend, woeid=item) for trend in trends]
+
+    raise ValueError(f'Unknown command: {command!r}')
+
+
+def run_concurrently(func, units, workers):
+    """
+    Call func on each unit in a thread pool, keeping at most a few
+    units per worker pending, and yield results as they complete.
+
+    :param func: Function taking a single unit argument
+    :param units: Iterable of work units
+    :param workers: Number of worker threads
+    :return: Generator of (unit, result, error) tuples
+    """
+
+    units = iter(units)
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        pending = {}
+        while True:
+            for unit in itertools.islice(units, 2 * workers - len(pending)):
+                pending[executor.submit(func, unit)] = unit
+            if not pending:
                 break
-            tweets.extend(results['statuses'])
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                unit = pending.pop(future)
+                try:
+                    yield unit, future.result(), None
+                except Exception as e:
+                    yield unit, None, e
 
-        return tweets
+
+def get_parser():
+    """
+    Build the command-line argument parser.
+
+    :return: argparse.ArgumentParser object
+    """
+
+    default_credentials = pathlib.Path.home().joinpath('.twitter', 'credentials.json')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('items', nargs='*',
+                        help='screen names, ids, queries or WOEIDs; default read from --input')
+    common.add_argument('-i', '--input',
+                        help="file of input items, one per line; '-' for stdin; "
+                             "default stdin if it isn't a terminal, except for trends")
+    common.add_argument('-o', '--output', default='-',
+                        help="output file; '-' for stdout (default)")
+    common.add_argument('-f', '--format', choices=('jsonl', 'csv', 'parquet'),
+                        help='output format; default from output file extension, else jsonl')
+    common.add_argument('-c', '--credentials', default=str(default_credentials),
+                        help='Twitter application credentials JSON file')
+    common.add_argument('-w', '--workers', type=int, default=1,
+                        help='concurrent requests; default 1')
+    common.add_argument('--checkpoint',
+                        help='file recording completed input items; '
+                             'completed items are skipped and output is appended')
+    common.add_argument('--progress', action='store_true',
+                        help='report progress on stderr')
+    common.add_argument('--index',
+                        help='TweetIndex database file to add collected tweets to')
+    common.set_defaults(ids=False, tweets=False)
+
+    parser = argparse.ArgumentParser(prog='twittertools',
+                                     description='Twitter API data acquisition tools')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    for name, help_text in (('timeline', "users' recent tweets"),
+                            ('favorites', "users' favorited tweets")):
+        command = commands.add_parser(name, parents=[common], help=help_text)
+        command.add_argument('--ids', action='store_true', help='items are numeric user IDs')
+        command.add_argument('--max-tweets', type=int, help='maximum tweets per user')
+
+    command = commands.add_parser('lookup', parents=[common], help='user profiles or tweets by id')
+    command.add_argument('--ids', action='store_true', help='items are numeric user IDs')
+    command.add_argument('--tweets', action='store_true', help='items are numeric tweet IDs')
+
+    for name in ('followers', 'friends'):
+        command = commands.add_parser(name, parents=[common], help=f"users' {name} IDs")
+        command.add_argument('--ids', action='store_true', help='items are numeric user IDs')
+        command.add_argument('--max-ids', type=int, help='maximum IDs per user')
+
+    command = commands.add_parser('search', parents=[common], help='tweets matching queries')
+    command.add_argument('--max-requests', type=int, default=5,
+                         help='maximum requests per query, up to 100 tweets each; default 5')
+
+    commands.add_parser('trends', parents=[common], help='trending topics by WOEID')
+
+    return parser
+
+
+def main(argv=None):
+    """
+    twittertools command-line entry point.
+
+    Examples:
+    python twittertools.py timeline katyperry BarackObama -o tweets.csv
+    python twittertools.py search -i queries.txt -o tweets.jsonl -w 4 --checkpoint done.txt
+
+    :param argv: Optional argument list; default sys.argv[1:]
+    :return: Exit status; 0 if every input item succeeded
+    """
+
+    args = get_parser().parse_args(argv)
+
+    items = args.items
+    if not items and args.input:
+        items = read_items(args.input)
+    if not items and args.command == 'trends':
+        # Worldwide trends, without waiting for stdin
+        items = ['1']
+    if not items and args.input is None and not sys.stdin.isatty():
+        items = read_items('-')
+
+    done = set()
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        done = set(read_items(args.checkpoint))
+    items = [item for item in items if item not in done]
+
+    # Lookups request up to 100 items per call; everything else, one item
+    size = 100 if args.command == 'lookup' else 1
+    units = [items[i:i + size] for i in range(0, len(items), size)]
+
+    file_format = args.format
+    if not file_format:
+        extension = os.path.splitext(args.output)[1].lstrip('.')
+        file_format = extension if extension in ('csv', 'parquet') else 'jsonl'
+
+    if args.command in ('followers', 'friends'):
+        unpack_func = unpack_connection
+    elif args.command == 'trends':
+        unpack_func = unpack_trend
+    elif args.command == 'lookup' and not args.tweets:
+        unpack_func = unpack_profile
+    else:
+        unpack_func = unpack_tweet
+
+    sink_class = {'jsonl': JsonLinesSink, 'csv': CsvSink, 'parquet': ParquetSink}[file_format]
+    sink = sink_class(args.output, unpack_func, append=bool(done))
+    checkpoint = open(args.checkpoint, mode='a', encoding='utf-8') if args.checkpoint else None
+    index = TweetIndex(args.index) if args.index and unpack_func is unpack_tweet else None
+
+    twt = TwitterTools(args.credentials)
+    fetch = functools.partial(fetch_command_item, twt, args)
+
+    status = 0
+    count = 0
+    started = time.monotonic()
+    try:
+        for i, (unit, results, error) in enumerate(run_concurrently(fetch, units, args.workers), 1):
+            if error:
+                status = 1
+                print(f'Error on {", ".join(unit)}: {error!r}', file=sys.stderr, flush=True)
+                continue
+
+            sink.write(results)
+            if index is not None:
+                index.add(results)
+            count += len(results)
+            if checkpoint:
+                checkpoint.write(''.join(f'{item}\n' for item in unit))
+                checkpoint.flush()
+            if args.progress:
+                elapsed = time.monotonic() - started
+                print(f'{i}/{len(units)} {", ".join(unit)[:40]}: {len(results)} results, '
+                      f'{count} total, {elapsed:.0f}s elapsed', file=sys.stderr, flush=True)
+    finally:
+        sink.close()
+        if checkpoint:
+            checkpoint.close()
+        if index is not None:
+            index.close()
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())